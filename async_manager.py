@@ -0,0 +1,93 @@
+"""
+asyncio front end of the contact database, for embedding in async services.
+
+Every operation of ContactRepository runs on a bounded thread pool, so SQLite
+I/O never blocks the event loop. Each worker thread reads through its own
+pooled connection and writes are serialized through the repository's writer.
+
+    async with AsyncContactManager("contacts.db") as contacts:
+        contact_id = await contacts.add("Jane", phones=["0912 345 678"])
+        async for contact in contacts.iter_contacts():
+            ...
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from repository import ContactRepository, CACHE_SIZE, EXPORT_BATCH_SIZE, PAGE_SIZE, SEARCH_LIMIT
+
+MAX_WORKERS = 4  # Threads running database operations
+
+
+class AsyncContactManager:
+    def __init__(self, db_name="contacts.db", max_workers=MAX_WORKERS, cache_size=CACHE_SIZE, cache_ttl=None):
+        self.repository = ContactRepository(db_name, cache_size, cache_ttl)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="contacts")
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def add(self, name, phones=None, emails=None, addresses=None, notes=""):
+        """
+        Adds a new contact and returns its ID.
+        """
+        return await self._run(self.repository.create_contact, name, phones, emails, addresses, notes)
+
+    async def get(self, contact_id):
+        """
+        Returns the contact with the given ID as a FrozenContact, or None.
+        """
+        contact = self.repository.cached_contact(contact_id)  # A cache hit needs no thread
+        if contact is not None:
+            return contact
+        return await self._run(self.repository.get_contact, contact_id)
+
+    async def list(self, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of (id, name, phones) tuples and the cursor of the next page.
+        """
+        return await self._run(self.repository.list_contacts, after, limit)
+
+    async def search(self, keyword, category="all", limit=SEARCH_LIMIT):
+        """
+        Returns ranked (id, name, phones) tuples matching the keyword in the category.
+        """
+        return await self._run(self.repository.search_contact, keyword, category, limit)
+
+    async def merge(self, contact_id, phones=None, emails=None, addresses=None, notes=""):
+        """
+        Merges additional details into an existing contact; returns True if it exists.
+        """
+        return await self._run(self.repository.merge_contact, contact_id, phones or [], emails or [], addresses or [], notes)
+
+    async def delete(self, contact_id):
+        """
+        Deletes a contact and its values; returns True if it existed.
+        """
+        return await self._run(self.repository.delete_contact, contact_id)
+
+    async def iter_contacts(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Asynchronously yields every contact as a Contact, ordered by ID.
+        Each batch of `batch_size` contacts is loaded by one executor call.
+        """
+        after = None
+        while True:
+            batch = await self._run(self.repository.load_batch, after, batch_size)
+            if not batch:
+                return
+            for contact in batch:
+                yield contact
+            after = batch.ids[-1]
+
+    async def close(self):
+        """
+        Waits for running operations and closes every connection.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.repository.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,31 @@
+"""
+One-time job filling in the lookup keys of phones and emails saved before
+the keys existed (schema version 6). New values get their keys when they
+are written, so this only needs to run once per database. Run with e.g.:
+
+    python backfill.py --db contacts.db
+"""
+import argparse
+
+from repository import ContactRepository, IMPORT_BATCH_SIZE
+from sharding import ShardedContactRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the missing phone and email lookup keys.")
+    parser.add_argument("--db", default="contacts.db", help="Contact database to backfill.")
+    parser.add_argument("--shards", nargs="+", help="Backfill these shard files instead of --db.")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows updated per transaction.")
+    args = parser.parse_args()
+
+    def report(table, done):
+        print(f"Filled in {done} {table}")
+
+    repository = ShardedContactRepository(args.shards) if args.shards else ContactRepository(args.db)
+    total = repository.backfill_keys(args.batch_size, report)
+    print(f"Done: {total} keys computed.")
+    repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,608 @@
+"""
+Benchmarks for the contact store.
+
+Generates deterministic synthetic databases and times the ContactRepository
+and ContactManager operations against them. Results can be saved as JSON,
+and two saved runs compared to flag regressions. Run with e.g.:
+
+    python benchmark.py --sizes 10000 100000 1000000 --output before.json
+    python benchmark.py --sizes 10000000 --suites manager listing search
+    python benchmark.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from itertools import islice
+
+try:
+    import resource  # Peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+import dedup
+from async_manager import AsyncContactManager
+from cache import LRUCache
+from contact import Contact, ContactBatch
+from contact_manager import ContactManager
+from repository import ContactRepository, PAGE_SIZE
+from exporter import WRITERS, snapshot
+from instrumentation import Instrumentation
+from sharding import ShardedContactRepository
+
+FIRST_NAMES = ["John", "Jon", "Jane", "Mary", "Minh", "Linh", "Bach", "Anna", "Peter", "Lan",
+               "David", "Sarah", "Huy", "Mai", "Tom", "Lucy", "Nam", "Hoa", "James", "Emma"]
+LAST_NAMES = ["Smith", "Nguyen", "Tran", "Do", "Le", "Pham", "Brown", "Johnson", "Hoang", "Vu",
+              "Miller", "Davis", "Wilson", "Bui", "Dang", "Taylor", "Clark", "Ngo", "Lewis", "Young"]
+STREETS = ["Dai Co Viet", "Tran Dai Nghia", "Main St", "High St", "Le Thanh Nghi", "Park Ave"]
+TOLERANCE_PCT = 20  # Change beyond which compare mode reports a regression
+HIGHER_IS_BETTER = ("_per_s", "hit_ratio_pct")  # Suffixes of metrics where a drop is the regression
+
+
+def synthetic_records(size, seed=0):
+    """
+    Yields `size` synthetic contact records with a realistic fan-out of phones,
+    emails and addresses. The same (size, seed) pair always yields the same data.
+    """
+    rng = random.Random(seed)
+    for contact_id in range(1, size + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {
+            "name": f"{first} {last}",
+            "notes": f"Note for contact {contact_id}" if rng.random() < 0.3 else "",
+            "phones": [f"+84 {rng.randint(300, 999)} {rng.randint(0, 999):03d} {rng.randint(0, 9999):04d}"
+                       for _ in range(rng.choice((0, 1, 1, 1, 2, 2, 3)))],
+            "emails": [f"{first.lower()}.{last.lower()}{rng.randint(0, 9999)}@example.com"
+                       for _ in range(rng.choice((0, 1, 1, 2)))],
+            "addresses": [f"{rng.randint(1, 500)} {rng.choice(STREETS)}, Hanoi"
+                          for _ in range(rng.choice((0, 0, 1, 1, 2)))],
+        }
+
+
+def generate_database(path, size, seed=0):
+    """
+    Fills the (new) database at `path` with `size` synthetic contacts, with IDs 1 to `size`.
+    """
+    repository = ContactRepository(path)
+    repository.conn.execute("PRAGMA journal_mode = OFF")
+    repository.conn.execute("PRAGMA synchronous = OFF")
+    # The suites pick IDs from 1 to `size`, so the contacts are numbered from 1 instead of from the node's range
+    repository.conn.execute("UPDATE sync_node SET first_contact_id = 0, last_contact_id = 0")
+    repository.conn.execute("UPDATE sync_ranges SET first_contact_id = 0")
+    repository.conn.commit()
+    repository.bulk_import(synthetic_records(size, seed), on_duplicate="create")
+    repository.pool.close()
+
+
+def timed(function, *args, repeat=5):
+    """
+    Runs `function` `repeat` times and returns the best wall-clock time in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_listing(repository, size):
+    """
+    Times the first page, a page in the middle of the list and a full keyset walk.
+    """
+    results = {
+        "first_page_ms": timed(repository.list_contacts),
+        "middle_page_ms": timed(repository.list_contacts, size // 2),
+    }
+
+    def walk():
+        rows, next_cursor = repository.list_contacts()
+        while next_cursor is not None:
+            rows, next_cursor = repository.list_contacts(next_cursor)
+
+    results["full_walk_ms"] = timed(walk, repeat=1)
+    return results
+
+
+def bench_search(repository):
+    """
+    Times a search per category with keywords that hit the generated data.
+    """
+    return {
+        "search_name_ms": timed(repository.search_contact, "Linh Ngu", "name"),
+        "search_phone_ms": timed(repository.search_contact, "345", "phone"),
+        "search_email_ms": timed(repository.search_contact, "emma.young", "email"),
+        "search_address_ms": timed(repository.search_contact, "park", "address"),
+        "search_all_ms": timed(repository.search_contact, "hoang", "all"),
+    }
+
+
+def bench_export(repository, workdir):
+    """
+    Times a full export in every format, with the peak memory traced while
+    exporting, which should stay flat as the database grows, and an online snapshot.
+    """
+    results = {}
+    for file_format, writer in WRITERS.items():
+        with open(os.devnull, "w") as file:
+            results[f"export_{file_format}_ms"] = timed(lambda: writer(repository.iter_contacts(), file), repeat=1)
+            tracemalloc.start()
+            writer(repository.iter_contacts(), file)
+            results[f"export_{file_format}_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+    path = os.path.join(workdir, "snapshot.db")
+    results["snapshot_ms"] = timed(snapshot, repository.conn, path, 1024, False, repeat=1)
+    os.remove(path)
+    return results
+
+
+class LegacyContact:
+    """
+    The Contact class as it was before it got __slots__, kept for comparison.
+    """
+    def __init__(self, id, name, phones=None, emails=None, addresses=None, notes=""):
+        self.id = id
+        self.name = name or "Unidentified contact"
+        self.phones = phones or []
+        self.emails = emails or []
+        self.addresses = addresses or []
+        self.notes = notes
+
+
+def bench_model(repository):
+    """
+    Compares the memory retained by, and construction time of, every contact
+    of the database held as legacy objects, slotted Contacts and one ContactBatch.
+    The rows are read beforehand, so only the containers are measured.
+    """
+    cursor = repository.conn.cursor()
+    contacts = cursor.execute("SELECT id, name, notes FROM contacts ORDER BY id").fetchall()
+    values = [cursor.execute(f"SELECT contact_id, {column} FROM {table} ORDER BY contact_id, id").fetchall()
+              for table, column in (("phones", "phone"), ("emails", "email"), ("addresses", "address"))]
+
+    def build_objects(cls):
+        grouped = [{} for _ in values]
+        for rows, groups in zip(values, grouped):
+            for contact_id, value in rows:
+                groups.setdefault(contact_id, []).append(value)
+        phones, emails, addresses = grouped
+        return [cls(contact_id, name, phones.get(contact_id), emails.get(contact_id), addresses.get(contact_id), notes)
+                for contact_id, name, notes in contacts]
+
+    builders = {
+        "legacy": lambda: build_objects(LegacyContact),
+        "slotted": lambda: build_objects(Contact),
+        "batch": lambda: ContactBatch.from_rows(contacts, *values),
+    }
+    results = {}
+    for name, build in builders.items():
+        results[f"model_{name}_ms"] = timed(build, repeat=3)
+        tracemalloc.start()
+        built = build()
+        results[f"model_{name}_kb"] = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+        del built
+    return results
+
+
+def bench_operations(repository, count=500):
+    """
+    Micro-benchmarks every write operation of the repository API: the average
+    time of one call, and of one row when `count` rows go through the batched
+    variant in a single transaction.
+    """
+    ids = [repository.create_contact(f"Bench {index}") for index in range(count)]
+    operations = [  # (operation, value used one call at a time, value used in one batch)
+        ("update_name", "Renamed", "Renamed again"),
+        ("set_notes", "Some notes", "Other notes"),
+        ("add_phone", "0912 345 678", "0912 345 679"),
+        ("remove_phone", "0912 345 678", "0912 345 679"),
+        ("add_email", "bench@example.com", "other@example.com"),
+        ("remove_email", "bench@example.com", "other@example.com"),
+        ("add_address", "1 Bench St", "2 Bench St"),
+        ("remove_address", "1 Bench St", "2 Bench St"),
+    ]
+    results = {}
+    for name, value, batch_value in operations:
+        operation, batched = getattr(repository, name), getattr(repository, f"{name}_many")
+        start = time.perf_counter()
+        for contact_id in ids:
+            operation(contact_id, value)
+        results[f"op_{name}_us"] = (time.perf_counter() - start) * 1e6 / count
+        start = time.perf_counter()
+        batched([(contact_id, batch_value) for contact_id in ids])
+        results[f"op_{name}_many_us"] = (time.perf_counter() - start) * 1e6 / count
+    start = time.perf_counter()
+    repository.create_contact("Bench single")
+    results["op_create_contact_us"] = (time.perf_counter() - start) * 1e6
+    start = time.perf_counter()
+    repository.delete_contact(ids[0])
+    results["op_delete_contact_us"] = (time.perf_counter() - start) * 1e6
+    start = time.perf_counter()
+    repository.delete_contact_many(ids[1:])
+    results["op_delete_contact_many_us"] = (time.perf_counter() - start) * 1e6 / (count - 1)
+    return results
+
+
+def bench_dedup(repository):
+    """
+    Times finding the duplicate groups of the whole database, then merging
+    them. Runs last, as merging changes the database.
+    """
+    start = time.perf_counter()
+    groups = dedup.find_duplicates(repository)[0]
+    results = {"dedup_find_ms": (time.perf_counter() - start) * 1000}
+    start = time.perf_counter()
+    dedup.merge_groups(repository, groups)
+    results["dedup_merge_ms"] = (time.perf_counter() - start) * 1000
+    return results
+
+
+def bench_instrumentation(path, size, pages=200):
+    """
+    Times listing pages with and without instrumentation, and returns the
+    overhead of recording every operation in percent.
+    """
+    results = {}
+    rng = random.Random(size)
+    for name, instrumentation in (("plain", None), ("instrumented", Instrumentation())):
+        repository = ContactRepository(path, instrumentation=instrumentation)
+        cursors = [rng.randrange(max(size - PAGE_SIZE, 1)) for _ in range(pages)]
+        start = time.perf_counter()
+        for after in cursors:
+            repository.list_contacts(after)
+        results[name] = time.perf_counter() - start
+        repository.close()
+    return {"instrumentation_pct": (results["instrumented"] / results["plain"] - 1) * 100}
+
+
+def bench_cache(repository, size, lookups=20000):
+    """
+    Times contact lookups over a hot set of 1000 IDs with the LRU cache
+    and with the cache disabled, and reports the cache counters.
+    """
+    rng = random.Random(size)
+    hot_ids = [rng.randint(1, size) for _ in range(1000)]
+    ids = [rng.choice(hot_ids) for _ in range(lookups)]
+
+    def lookup_all():
+        for contact_id in ids:
+            repository.get_contact(contact_id)
+
+    cache = repository.cache
+    repository.cache = LRUCache(0)
+    uncached = timed(lookup_all, repeat=1)
+    repository.cache = LRUCache(cache.maxsize)
+    cached = timed(lookup_all, repeat=1)
+    stats = repository.cache.stats()
+    repository.cache = cache
+    return {
+        "lookup_uncached_us": uncached * 1000 / lookups,
+        "lookup_cached_us": cached * 1000 / lookups,
+        "cache_hit_ratio_pct": 100 * stats["hits"] / (stats["hits"] + stats["misses"]),
+    }
+
+
+def bench_concurrency(repository, size, duration=1.0):
+    """
+    Measures read throughput (uncached contact lookups and list pages) with
+    1, 2, 4 and 8 reader threads while one writer thread keeps importing
+    small batches, and the writer's own throughput.
+    """
+    cache = repository.cache
+    repository.cache = LRUCache(0)  # Every lookup goes to the database
+    results = {}
+    for threads in (1, 2, 4, 8):
+        stop = threading.Event()
+        reads = [0] * threads
+        writes = [0]
+
+        def read(slot):
+            rng = random.Random(slot)
+            while not stop.is_set():
+                repository.get_contact(rng.randint(1, size))
+                repository.list_contacts(rng.randint(0, size))
+                reads[slot] += 2
+
+        def write():
+            records = synthetic_records(10 ** 9, seed=threads)
+            while not stop.is_set():
+                repository.bulk_import(islice(records, 10), on_duplicate="create")
+                writes[0] += 10
+
+        workers = [threading.Thread(target=read, args=(slot,)) for slot in range(threads)]
+        workers.append(threading.Thread(target=write))
+        for worker in workers:
+            worker.start()
+        time.sleep(duration)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        results[f"reads_{threads}_threads_per_s"] = sum(reads) / duration
+        results[f"writes_{threads}_threads_per_s"] = writes[0] / duration
+    repository.cache = cache
+    return results
+
+
+def bench_async(path, size, requests=2000):
+    """
+    Runs `requests` lookups, list pages and searches through AsyncContactManager
+    with 1, 10 and 100 of them in flight at once, while a probe coroutine
+    measures how late the event loop wakes it up every millisecond. The lag
+    should stay flat as concurrency grows, because no query runs on the loop.
+    """
+    async def run(concurrency):
+        contacts = AsyncContactManager(path, cache_size=0)
+        rng = random.Random(concurrency)
+        lags = []
+        done = asyncio.Event()
+
+        async def probe():
+            loop = asyncio.get_running_loop()
+            while not done.is_set():
+                start = loop.time()
+                await asyncio.sleep(0.001)
+                lags.append((loop.time() - start - 0.001) * 1000)
+
+        async def client(count):
+            for _ in range(count):
+                kind = rng.randrange(3)
+                if kind == 0:
+                    await contacts.get(rng.randint(1, size))
+                elif kind == 1:
+                    await contacts.list(rng.randint(0, size))
+                else:
+                    await contacts.search(rng.choice(FIRST_NAMES), "name")
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(client(requests // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+        await contacts.close()
+        lags.sort()
+        return {
+            f"async_{concurrency}_requests_per_s": requests / elapsed,
+            f"async_{concurrency}_loop_lag_p99_ms": lags[int(len(lags) * 0.99)] if lags else 0.0,
+        }
+
+    results = {}
+    for concurrency in (1, 10, 100):
+        results.update(asyncio.run(run(concurrency)))
+    return results
+
+
+def _shard_writer(paths, index, start, stop, writes):
+    """
+    Adds contacts placed on shard `index` through a ShardedContactRepository
+    from the moment every writer reaches the `start` barrier until `stop` is
+    set, then puts the number added in `writes`.
+    Runs in its own process.
+    """
+    repository = ShardedContactRepository(paths)
+    records = (record for record in synthetic_records(10 ** 9, seed=index) if repository._placement(record["name"]) == index)
+    count = 0
+    start.wait()
+    while not stop.is_set():
+        record = next(records)
+        repository.create_contact(record["name"], record["phones"], record["emails"], record["addresses"], record["notes"])
+        count += 1
+    repository.close()
+    writes.put(count)
+
+
+def bench_sharding(workdir, shard_counts=(1, 2, 4), duration=1.0):
+    """
+    Measures write throughput over 1, 2 and 4 shard files, with one writer
+    process per shard adding contacts as fast as it can. Processes, unlike
+    threads, do not share the GIL, so the writes scale with the shards up
+    to the number of CPUs.
+    """
+    results = {}
+    for count in shard_counts:
+        paths = [os.path.join(workdir, f"shard_{count}_{index}.db") for index in range(count)]
+        ShardedContactRepository(paths).close()  # Creates the schemas before any writer opens the shards
+        start, stop, writes = multiprocessing.Barrier(count + 1), multiprocessing.Event(), multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_shard_writer, args=(paths, index, start, stop, writes))
+                     for index in range(count)]
+        for process in processes:
+            process.start()
+        start.wait()  # Every writer has opened its connections
+        time.sleep(duration)
+        stop.set()
+        total = sum(writes.get() for _ in processes)
+        for process in processes:
+            process.join()
+        for path in paths:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        results[f"shards_{count}_writes_per_s"] = total / duration
+    return results
+
+
+def percentile(samples, fraction):
+    """
+    Returns the value below which `fraction` of the sorted samples fall.
+    """
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)] if samples else 0.0
+
+
+def latencies(name, function, arguments):
+    """
+    Calls `function` once per tuple of `arguments` and returns the p50 and
+    p99 latency in microseconds and the throughput in calls per second.
+    """
+    samples = []
+    start = time.perf_counter()
+    for args in arguments:
+        call_start = time.perf_counter()
+        function(*args)
+        samples.append((time.perf_counter() - call_start) * 1e6)
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {
+        f"{name}_p50_us": percentile(samples, 0.5),
+        f"{name}_p99_us": percentile(samples, 0.99),
+        f"{name}_per_s": len(samples) / elapsed,
+    }
+
+
+def bench_manager(path, size, samples=1000):
+    """
+    Times the operations of the interactive ContactManager, with their output
+    discarded: a full show_all_contacts, and `samples` inspect lookups (the
+    uncached get_contact behind inspect_contact), add_contact calls,
+    merge_contact calls and searches, each with its p50, p99 and throughput.
+    """
+    manager = ContactManager(path, cache_size=0)
+    rng = random.Random(size)
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["manager_show_all_ms"] = timed(manager.show_all_contacts, repeat=1)
+        results.update(latencies("manager_inspect", manager.get_contact,
+                                 [(rng.randint(1, size),) for _ in range(samples)]))
+        results.update(latencies("manager_add", manager.add_contact,
+                                 [(f"Bench Add {index}", [f"+84 900 {index:07d}"], [f"add{index}@example.com"])
+                                  for index in range(samples)]))
+        results.update(latencies("manager_merge", manager.merge_contact,
+                                 [(rng.randint(1, size), [f"+84 901 {index:07d}"], [], [], "Merged")
+                                  for index in range(samples)]))
+        keywords = [(rng.choice(FIRST_NAMES + LAST_NAMES), category)
+                    for category in ("name", "all") for _ in range(samples // 4)]
+        keywords += [(f"{rng.randint(100, 999)}", "phone") for _ in range(samples // 4)]
+        keywords += [(f"{rng.choice(FIRST_NAMES).lower()}.", "email") for _ in range(samples // 4)]
+        rng.shuffle(keywords)
+        results.update(latencies("manager_search", manager.search_contact, keywords))
+    manager.close()
+    return results
+
+
+def peak_rss_kb():
+    """
+    Returns the peak resident memory of this process so far, in kB, or 0 where unknown.
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == "darwin" else float(peak)  # Bytes on macOS, kB elsewhere
+
+
+SUITES = {  # name -> function(repository, path, size, workdir), in the order they run
+    "manager": lambda repository, path, size, workdir: bench_manager(path, size),
+    "listing": lambda repository, path, size, workdir: bench_listing(repository, size),
+    "search": lambda repository, path, size, workdir: bench_search(repository),
+    "export": lambda repository, path, size, workdir: bench_export(repository, workdir),
+    "model": lambda repository, path, size, workdir: bench_model(repository),
+    "cache": lambda repository, path, size, workdir: bench_cache(repository, size),
+    "operations": lambda repository, path, size, workdir: bench_operations(repository),
+    "concurrency": lambda repository, path, size, workdir: bench_concurrency(repository, size),
+    "async": lambda repository, path, size, workdir: bench_async(path, size),
+    "instrumentation": lambda repository, path, size, workdir: bench_instrumentation(path, size),
+    "sharding": lambda repository, path, size, workdir: bench_sharding(workdir),
+    "dedup": lambda repository, path, size, workdir: bench_dedup(repository),  # Changes the database, so runs last
+}
+
+
+def unit_of(name):
+    return {"kb": "kB", "us": "us", "pct": "%", "s": "/s"}.get(name.rsplit("_", 1)[-1], "ms")
+
+
+def run(sizes, seed=0, suites=tuple(SUITES)):
+    """
+    Generates a database per size and runs the chosen suites against it,
+    printing every result. Returns {size: {metric: value}}. Peak RSS is the
+    peak of the whole process so far, so it is exact for the largest size
+    only when sizes run in increasing order.
+    """
+    runs = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            path = os.path.join(workdir, f"contacts_{size}.db")
+            start = time.perf_counter()
+            generate_database(path, size, seed)
+            results = {"generate_ms": (time.perf_counter() - start) * 1000}
+            repository = ContactRepository(path)
+            for suite in SUITES:
+                if suite in suites:
+                    results.update(SUITES[suite](repository, path, size, workdir))
+            repository.pool.close()
+            results["peak_rss_kb"] = peak_rss_kb()
+            for name, value in results.items():
+                print(f"{size:>10} contacts  {name:<32} {value:12.2f} {unit_of(name)}")
+            runs[str(size)] = results
+            os.remove(path)
+    return runs
+
+
+def compare(before, after, tolerance=TOLERANCE_PCT):
+    """
+    Prints every metric present in two saved runs with its change, marking
+    changes for the worse beyond `tolerance` percent. Returns the number of
+    regressions.
+    """
+    regressions = 0
+    for size, results in after["results"].items():
+        baseline = before["results"].get(size, {})
+        for name, value in results.items():
+            if name not in baseline or name == "generate_ms":
+                continue
+            old = baseline[name]
+            change = (value - old) / old * 100 if old else 0.0
+            worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"{size:>10} contacts  {name:<32} {old:12.2f} -> {value:12.2f} {unit_of(name):<3} {change:+7.1f}% {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the contact store.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Number of contacts in each generated database, e.g. 10000 100000 1000000 10000000.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data generator.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES), help="Benchmarks to run.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two saved runs instead of benchmarking; exits with 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_PCT, help="Percent change reported as a regression.")
+    args = parser.parse_args()
+
+    if args.compare:
+        runs = []
+        for path in args.compare:
+            with open(path, encoding="utf-8") as file:
+                runs.append(json.load(file))
+        regressions = compare(*runs, args.tolerance)
+        print(f"{regressions} regression(s) beyond {args.tolerance}%.")
+        sys.exit(1 if regressions else 0)
+
+    results = run(args.sizes, args.seed, args.suites)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({
+                "seed": args.seed,
+                "suites": args.suites,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),  # The sharding suite scales up to this many shards
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, file, indent=2)
+        print(f"Results saved to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache with an optional time to live.
+    Counts hits, misses and evictions (entries dropped to make room or
+    because they expired). A cache with a `maxsize` of 0 stores nothing.
+
+    The cache is thread-safe. To avoid caching a value read before a
+    concurrent write, read `generation` before loading the value and pass it
+    to put(): the value is dropped if anything was invalidated in between.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (value, expiry time or None), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # Incremented by every invalidation
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for `key` and marks it as recently used,
+        or returns `default` if it is missing or has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self.entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """
+        Caches `value` for `key`, evicting the least recently used entries if
+        the cache is full. Does nothing if `generation` is given and an entry
+        was invalidated since it was read.
+        """
+        if self.maxsize <= 0:
+            return
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Drops the entry of `key`, if any.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops every entry; the counters are kept.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns the counters and the current number of entries.
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
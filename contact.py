@@ -1,4 +1,9 @@
+from array import array
+
+
 class Contact:
+    __slots__ = ("id", "name", "phones", "emails", "addresses", "notes")
+
     def __init__(self, id, name, phones=None, emails=None, addresses=None, notes=""):
         self.id = id
         self.name = name or "Unidentified contact"
@@ -10,3 +15,129 @@ class Contact:
     def __str__(self):
         return (f"Contact(ID: {self.id}, Name: {self.name}, Phones: {self.phones}, "
                 f"Emails: {self.emails}, Addresses: {self.addresses}, Notes: {self.notes})")
+
+    def __eq__(self, other):
+        if not isinstance(other, Contact):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None  # Mutable, see FrozenContact
+
+    def to_dict(self):
+        """
+        Returns the contact as a plain dict, with lists of phones, emails and addresses.
+        """
+        return {"id": self.id, "name": self.name, "notes": self.notes, "phones": list(self.phones),
+                "emails": list(self.emails), "addresses": list(self.addresses)}
+
+    def freeze(self):
+        """
+        Returns an immutable, hashable copy of the contact.
+        """
+        return FrozenContact(self.id, self.name, self.phones, self.emails, self.addresses, self.notes)
+
+
+class FrozenContact(Contact):
+    """
+    A Contact that cannot be modified once created; its phones, emails and
+    addresses are tuples.
+    """
+    __slots__ = ()
+
+    def __init__(self, id, name, phones=None, emails=None, addresses=None, notes=""):
+        set_field = object.__setattr__
+        set_field(self, "id", id)
+        set_field(self, "name", name or "Unidentified contact")
+        set_field(self, "phones", tuple(phones or ()))
+        set_field(self, "emails", tuple(emails or ()))
+        set_field(self, "addresses", tuple(addresses or ()))
+        set_field(self, "notes", notes)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FrozenContact is immutable, cannot set '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"FrozenContact is immutable, cannot delete '{name}'")
+
+    def __hash__(self):
+        return hash((self.id, self.name, self.phones, self.emails, self.addresses, self.notes))
+
+    def freeze(self):
+        return self
+
+
+class ContactBatch:
+    """
+    Columnar container for many contacts. IDs, names and notes are stored in
+    one column each, and the phones, emails and addresses of all contacts in
+    one flat list per kind, with an offsets array marking where the values of
+    each contact start. Scanning a large batch therefore allocates no per-contact
+    objects; Contact objects are only built on indexing or iteration.
+    """
+    VALUE_COLUMNS = ("phones", "emails", "addresses")
+    __slots__ = ("ids", "names", "notes", "values", "offsets")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.names = []
+        self.notes = []
+        self.values = {column: [] for column in self.VALUE_COLUMNS}
+        self.offsets = {column: array("q", [0]) for column in self.VALUE_COLUMNS}  # offsets[i]:offsets[i + 1] are contact i's values
+
+    @classmethod
+    def from_rows(cls, contacts, phones=(), emails=(), addresses=()):
+        """
+        Builds a batch from (id, name, notes) rows sorted by ID and
+        (contact_id, value) rows of each kind sorted by contact ID.
+        Values of IDs that are not in `contacts` are ignored.
+        """
+        batch = cls()
+        for contact_id, name, notes in contacts:
+            batch.ids.append(contact_id)
+            batch.names.append(name)
+            batch.notes.append(notes or "")
+        for column, rows in zip(cls.VALUE_COLUMNS, (phones, emails, addresses)):
+            values, offsets = batch.values[column], batch.offsets[column]
+            rows = iter(rows)
+            row = next(rows, None)
+            for contact_id in batch.ids:
+                while row is not None and row[0] < contact_id:
+                    row = next(rows, None)
+                while row is not None and row[0] == contact_id:
+                    values.append(row[1])
+                    row = next(rows, None)
+                offsets.append(len(values))
+        return batch
+
+    def append(self, contact):
+        """
+        Appends a Contact (or any object with the same attributes) to the batch.
+        """
+        self.ids.append(contact.id)
+        self.names.append(contact.name)
+        self.notes.append(contact.notes or "")
+        for column in self.VALUE_COLUMNS:
+            self.values[column].extend(getattr(contact, column))
+            self.offsets[column].append(len(self.values[column]))
+
+    def values_of(self, index, column):
+        """
+        Returns the phones, emails or addresses (`column`) of the contact at `index` as a list.
+        """
+        offsets = self.offsets[column]
+        return self.values[column][offsets[index]:offsets[index + 1]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError("ContactBatch index out of range")
+        return Contact(self.ids[index], self.names[index], self.values_of(index, "phones"),
+                       self.values_of(index, "emails"), self.values_of(index, "addresses"), self.notes[index])
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
@@ -1,64 +1,25 @@
-import sqlite3
-from contact import Contact  # Import the Contact class
+from repository import ContactRepository, PAGE_SIZE, SEARCH_LIMIT
 from utils import special_input, ReturnToMainMenu, ReturnToPreviousStep  # Exceptions for navigation
 
-class ContactManager:
-    def __init__(self, db_name="contacts.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        """
-        Create database tables if they don't already exist.
-        """
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS contacts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                notes TEXT
-            );
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS phones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                contact_id INTEGER NOT NULL,
-                phone TEXT NOT NULL,
-                FOREIGN KEY (contact_id) REFERENCES contacts (id)
-            );
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS emails (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                contact_id INTEGER NOT NULL,
-                email TEXT NOT NULL,
-                FOREIGN KEY (contact_id) REFERENCES contacts (id)
-            );
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS addresses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                contact_id INTEGER NOT NULL,
-                address TEXT NOT NULL,
-                FOREIGN KEY (contact_id) REFERENCES contacts (id)
-            );
-        """)
-        self.conn.commit()
+class ContactManager(ContactRepository):
+    """
+    Interactive front end of the contact database: prompts and prints around
+    the headless operations of ContactRepository.
+    """
 
     def add_contact(self, name, phones=None, emails=None, addresses=None, notes=""):
         """
-        Adds a new contact to the database.
+        Adds a new contact to the database, offering to merge it into an
+        existing contact with the same name.
         """
         phones = phones or []
         emails = emails or []
         addresses = addresses or []
 
         # Check for duplicate names
-        self.cursor.execute("SELECT id, name FROM contacts WHERE name = ?", (name,))
-        result = self.cursor.fetchone()
+        contact_id = self.find_contact_id(name)
 
-        if result:
-            contact_id = result[0]
+        if contact_id is not None:
             print(f"A contact with the name '{name}' already exists.")
             choice = special_input("Do you want to merge the contacts? (yes/no): ", step="merge_prompt").lower()
             if choice == "yes":
@@ -66,75 +27,54 @@ class ContactManager:
                 print(f"Contact '{name}' merged successfully.")
                 return
 
-        # Add new contact
-        self.cursor.execute("INSERT INTO contacts (name, notes) VALUES (?, ?)", (name, notes))
-        contact_id = self.cursor.lastrowid
-
-        for phone in phones:
-            self.cursor.execute("INSERT INTO phones (contact_id, phone) VALUES (?, ?)", (contact_id, phone))
-        for email in emails:
-            self.cursor.execute("INSERT INTO emails (contact_id, email) VALUES (?, ?)", (contact_id, email))
-        for address in addresses:
-            self.cursor.execute("INSERT INTO addresses (contact_id, address) VALUES (?, ?)", (contact_id, address))
-
-        self.conn.commit()
+        self.create_contact(name, phones, emails, addresses, notes)
         print(f"Contact '{name}' added successfully.")
 
-    def merge_contact(self, contact_id, phones, emails, addresses, notes):
+    def show_contacts_page(self, after=None, limit=PAGE_SIZE):
         """
-        Merges additional details into an existing contact.
+        Displays one page of contacts and returns (number of rows shown, next cursor).
         """
-        for phone in phones:
-            self.cursor.execute("INSERT OR IGNORE INTO phones (contact_id, phone) VALUES (?, ?)", (contact_id, phone))
-        for email in emails:
-            self.cursor.execute("INSERT OR IGNORE INTO emails (contact_id, email) VALUES (?, ?)", (contact_id, email))
-        for address in addresses:
-            self.cursor.execute("INSERT OR IGNORE INTO addresses (contact_id, address) VALUES (?, ?)", (contact_id, address))
-
-        # Append notes
-        self.cursor.execute("SELECT notes FROM contacts WHERE id = ?", (contact_id,))
-        existing_notes = self.cursor.fetchone()[0]
-        updated_notes = f"{existing_notes}\n{notes}" if existing_notes else notes
-        self.cursor.execute("UPDATE contacts SET notes = ? WHERE id = ?", (updated_notes, contact_id))
-        self.conn.commit()
+        rows, next_cursor = self.list_contacts(after, limit)
+        for contact_id, name, phones in rows:
+            print(f"ID: {contact_id}, Name: {name}, Phone(s): {phones or ''}")
+        return len(rows), next_cursor
 
     def show_all_contacts(self):
         """
-        Displays all contacts with their names and phone numbers.
+        Displays all contacts with their names and phone numbers, page by page.
         """
-        self.cursor.execute("SELECT id, name FROM contacts")
-        contacts = self.cursor.fetchall()
-        if not contacts:
+        shown, next_cursor = self.show_contacts_page()
+        if not shown:
             return 0
-        for contact_id, name in contacts:
-            self.cursor.execute("SELECT phone FROM phones WHERE contact_id = ?", (contact_id,))
-            phones = [row[0] for row in self.cursor.fetchall()]
-            phone_display = ", ".join(phones) if phones else ""
-            print(f"ID: {contact_id}, Name: {name}, Phone(s): {phone_display}")
+        while next_cursor is not None:
+            shown, next_cursor = self.show_contacts_page(next_cursor)
         return 1
 
+    def search_contact(self, keyword, category="all", limit=SEARCH_LIMIT):
+        """
+        Searches contacts like ContactRepository.search_contact, reporting an
+        invalid category instead of raising.
+        """
+        try:
+            return super().search_contact(keyword, category, limit)
+        except ValueError as e:
+            print(e)
+            return []
+
     def inspect_contact(self, contact_id):
         """
         Displays all details of a contact by ID in a formatted, readable manner,
         with options to update, add, or delete specific categories of the record.
         """
         try:
-            self.cursor.execute("SELECT name, notes FROM contacts WHERE id = ?", (contact_id,))
-            result = self.cursor.fetchone()
+            contact = self.get_contact(contact_id)
 
-            if not result:
+            if not contact:
                 print(f"No contact found with ID {contact_id}.")
                 return
 
-            name, notes = result
-            self.cursor.execute("SELECT phone FROM phones WHERE contact_id = ?", (contact_id,))
-            phones = [row[0] for row in self.cursor.fetchall()]
-
-            self.cursor.execute("SELECT email FROM emails WHERE contact_id = ?", (contact_id,))
-            emails = [row[0] for row in self.cursor.fetchall()]
-
-            self.cursor.execute("SELECT address FROM addresses WHERE contact_id = ?", (contact_id,))
-            addresses = [row[0] for row in self.cursor.fetchall()]
+            name, notes = contact.name, contact.notes
+            phones, emails, addresses = list(contact.phones), list(contact.emails), list(contact.addresses)
 
             while True:
                 try:
@@ -159,8 +99,7 @@ class ContactManager:
                             if sub_choice == "1":
                                 try:
                                     new_name = special_input("Enter new name: ", step="update_name")
-                                    self.cursor.execute("UPDATE contacts SET name = ? WHERE id = ?", (new_name, contact_id))
-                                    self.conn.commit()
+                                    self.update_name(contact_id, new_name)
                                     name = new_name
                                     print("Name updated successfully.")
                                 except Exception as e:
@@ -180,11 +119,12 @@ class ContactManager:
                             sub_choice = special_input("Enter your choice: ", step="manage_phones")
                             if sub_choice == "1":
                                 try:
-                                    new_phone = special_input("Enter new phone: ", step="add_phone")
-                                    self.cursor.execute("INSERT INTO phones (contact_id, phone) VALUES (?, ?)", (contact_id, new_phone))
-                                    phones.append(new_phone)
-                                    self.conn.commit()
-                                    print("Phone added successfully.")
+                                    new_phone = special_input("Enter new phone: ", step="add_phone").strip()
+                                    if self.add_phone(contact_id, new_phone):
+                                        phones.append(new_phone)
+                                        print("Phone added successfully.")
+                                    else:
+                                        print("The phone is empty or already saved.")
                                 except Exception as e:
                                     print(f"An error occurred while adding a phone: {e}")
                                     raise ReturnToPreviousStep
@@ -199,9 +139,8 @@ class ContactManager:
                                     phone_index = int(special_input("Enter the number of the phone to remove: ", step="remove_phone_index")) - 1
                                     if 0 <= phone_index < len(phones):
                                         phone_to_remove = phones[phone_index]
-                                        self.cursor.execute("DELETE FROM phones WHERE contact_id = ? AND phone = ?", (contact_id, phone_to_remove))
+                                        self.remove_phone(contact_id, phone_to_remove)
                                         phones.pop(phone_index)
-                                        self.conn.commit()
                                         print("Phone removed successfully.")
                                     else:
                                         print("Invalid selection. Please try again.")
@@ -224,11 +163,12 @@ class ContactManager:
                             sub_choice = special_input("Enter your choice: ", step="manage_emails")
                             if sub_choice == "1":
                                 try:
-                                    new_email = special_input("Enter new email: ", step="add_email")
-                                    self.cursor.execute("INSERT INTO emails (contact_id, email) VALUES (?, ?)", (contact_id, new_email))
-                                    emails.append(new_email)
-                                    self.conn.commit()
-                                    print("Email added successfully.")
+                                    new_email = special_input("Enter new email: ", step="add_email").strip()
+                                    if self.add_email(contact_id, new_email):
+                                        emails.append(new_email)
+                                        print("Email added successfully.")
+                                    else:
+                                        print("The email is empty or already saved.")
                                 except Exception as e:
                                     print(f"An error occurred while adding an email: {e}")
                                     raise ReturnToPreviousStep
@@ -243,9 +183,8 @@ class ContactManager:
                                     email_index = int(special_input("Enter the number of the email to remove: ", step="remove_email_index")) - 1
                                     if 0 <= email_index < len(emails):
                                         email_to_remove = emails[email_index]
-                                        self.cursor.execute("DELETE FROM emails WHERE contact_id = ? AND email = ?", (contact_id, email_to_remove))
+                                        self.remove_email(contact_id, email_to_remove)
                                         emails.pop(email_index)
-                                        self.conn.commit()
                                         print("Email removed successfully.")
                                     else:
                                         print("Invalid selection. Please try again.")
@@ -268,11 +207,12 @@ class ContactManager:
                             sub_choice = special_input("Enter your choice: ", step="manage_addresses")
                             if sub_choice == "1":
                                 try:
-                                    new_address = special_input("Enter new address: ", step="add_address")
-                                    self.cursor.execute("INSERT INTO addresses (contact_id, address) VALUES (?, ?)", (contact_id, new_address))
-                                    addresses.append(new_address)
-                                    self.conn.commit()
-                                    print("Address added successfully.")
+                                    new_address = special_input("Enter new address: ", step="add_address").strip()
+                                    if self.add_address(contact_id, new_address):
+                                        addresses.append(new_address)
+                                        print("Address added successfully.")
+                                    else:
+                                        print("The address is empty or already saved.")
                                 except Exception as e:
                                     print(f"An error occurred while adding an address: {e}")
                                     raise ReturnToPreviousStep
@@ -287,9 +227,8 @@ class ContactManager:
                                     address_index = int(special_input("Enter the number of the address to remove: ", step="remove_address_index")) - 1
                                     if 0 <= address_index < len(addresses):
                                         address_to_remove = addresses[address_index]
-                                        self.cursor.execute("DELETE FROM addresses WHERE contact_id = ? AND address = ?", (contact_id, address_to_remove))
+                                        self.remove_address(contact_id, address_to_remove)
                                         addresses.pop(address_index)
-                                        self.conn.commit()
                                         print("Address removed successfully.")
                                     else:
                                         print("Invalid selection. Please try again.")
@@ -312,8 +251,7 @@ class ContactManager:
                             if sub_choice == "1":
                                 try:
                                     new_notes = special_input("Enter new notes: ", step="update_notes")
-                                    self.cursor.execute("UPDATE contacts SET notes = ? WHERE id = ?", (new_notes, contact_id))
-                                    self.conn.commit()
+                                    self.set_notes(contact_id, new_notes)
                                     notes = new_notes
                                     print("Notes updated successfully.")
                                 except Exception as e:
@@ -0,0 +1,304 @@
+"""
+Offline detection and merging of duplicate contacts.
+
+Contacts are never compared pairwise across the whole database. Every contact
+gets a few blocking keys: the last digits of each phone, each email, both from
+the lookup keys stored with them, and a phonetic key of its name. Only contacts sharing a key are compared, and
+the keys are grouped by SQLite in a scratch database, so memory stays bounded
+and any repository with iter_lookup_keys, sharded or not, can be deduplicated.
+Contacts sharing no phone or email are matched on similar names alone, but
+only within small name blocks and never into a group with other details.
+Such matches are only reported, unless --merge-name-only is given.
+Candidate pairs are scored, optionally on a process pool, and every group of
+duplicates is merged into its oldest contact in batched transactions. Run with:
+
+    python dedup.py --dry-run
+    python dedup.py --workers 4
+    python dedup.py --merge-name-only
+"""
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from itertools import combinations, repeat
+
+from repository import ContactRepository, EXPORT_BATCH_SIZE
+PHONE_KEY_DIGITS = 9  # Trailing digits of the phone keys compared, so a wrong calling code still matches
+MIN_PHONE_DIGITS = 7  # Shorter phones are too ambiguous to block on
+MAX_BLOCK_SIZE = 100  # Keys shared by more contacts are skipped
+MAX_NAME_BLOCK_SIZE = 10  # Name keys shared by more contacts are too common to match on the name alone
+THRESHOLD = 0.8  # Minimum score of a duplicate pair
+PHONE_WEIGHT = 0.5  # Score of a shared phone
+EMAIL_WEIGHT = 0.5  # Score of a shared email
+NAME_WEIGHT = 0.5  # Score of identical names, scaled down by their similarity
+NAME_ONLY_SIMILARITY = 0.9  # Minimum similarity of the names of a pair sharing no phone or email
+SCORE_CHUNK_SIZE = 5000  # Candidate pairs sent to a worker process at a time
+FEATURE_CHUNK_SIZE = 500  # Contacts loaded per query when scoring
+MERGE_BATCH_SIZE = 1000  # Duplicates merged per transaction
+
+SOUNDEX_CODES = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+                 "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+
+
+def soundex(word):
+    """
+    Returns the American Soundex code of a word, e.g. "John" and "Jon" -> "J500".
+    """
+    letters = [char for char in word.lower() if char.isalpha()]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+        if char not in "hw":  # H and W do not separate letters with the same code
+            previous = digit
+    return (code + "000")[:4]
+
+
+def normalize_name(name):
+    """
+    Returns a name lowercased, with its words sorted, so "Smith, John" and "john smith" compare equal.
+    """
+    words = "".join(char if char.isalnum() else " " for char in name.lower()).split()
+    return " ".join(sorted(words))
+
+
+def phone_block_key(key):
+    """
+    Returns the blocking key of a phone from its stored lookup key (see
+    utils.phone_key), or None if the number has too few digits.
+    """
+    digits = key.lstrip("+")
+    return digits[-PHONE_KEY_DIGITS:] if len(digits) >= MIN_PHONE_DIGITS else None
+
+
+def name_key(name):
+    """
+    Returns the phonetic blocking key of a name: the sorted Soundex codes of its words.
+    """
+    return " ".join(sorted(filter(None, (soundex(word) for word in normalize_name(name).split()))))
+
+
+def blocking_keys(name, phone_keys, email_keys):
+    """
+    Yields the blocking keys of a contact, prefixed by their kind, from its
+    name and the lookup keys of its phones and emails.
+    """
+    for phone in phone_keys:
+        key = phone_block_key(phone)
+        if key:
+            yield "p:" + key
+    for email in email_keys:
+        yield "e:" + email
+    key = name_key(name)
+    if key:
+        yield "n:" + key
+
+
+def score_pair(first, second):
+    """
+    Scores how likely two contacts are the same person, from 0 to 1. Each
+    contact is a (name, phone keys, email keys) tuple. A pair sharing no
+    phone or email is scored on its names alone, and only if it has no
+    conflicting details: it scores the similarity of the names if at least
+    NAME_ONLY_SIMILARITY, else 0, so "Jon Smith" matches "John Smith".
+    """
+    score = 0.0
+    if first[1] & second[1]:
+        score += PHONE_WEIGHT
+    if first[2] & second[2]:
+        score += EMAIL_WEIGHT
+    if score:
+        return min(score + NAME_WEIGHT * SequenceMatcher(None, first[0], second[0]).ratio(), 1.0)
+    if (first[1] and second[1]) or (first[2] and second[2]):  # Different phones or emails: different people
+        return 0.0
+    matcher = SequenceMatcher(None, first[0], second[0])
+    if matcher.real_quick_ratio() < NAME_ONLY_SIMILARITY or matcher.quick_ratio() < NAME_ONLY_SIMILARITY:
+        return 0.0  # Cheap upper bounds of the ratio rule most pairs out
+    similarity = matcher.ratio()
+    return similarity if similarity >= NAME_ONLY_SIMILARITY else 0.0
+
+
+def score_pairs(pairs, threshold=THRESHOLD):
+    """
+    Returns (id, id, shares details) for the pairs scoring at least
+    `threshold`; the flag is False for pairs matched on their names alone.
+    Each pair is a (id, features, id, features) tuple. Runs in worker processes.
+    """
+    return [(first_id, second_id, bool(first[1] & second[1] or first[2] & second[2]))
+            for first_id, first, second_id, second in pairs if score_pair(first, second) >= threshold]
+
+
+def _collect_keys(repository, conn, batch_size):
+    """
+    Fills the dedup_keys table of the scratch database with the blocking keys
+    of every contact, and dedup_features with what score_pair compares.
+    Returns the number of contacts read.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS dedup_keys (key TEXT NOT NULL, contact_id INTEGER NOT NULL)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dedup_features (
+            contact_id INTEGER PRIMARY KEY, name TEXT NOT NULL, phones TEXT NOT NULL, emails TEXT NOT NULL
+        )
+    """)
+    count = 0
+    for batch in repository.iter_lookup_keys(batch_size):
+        keys, features = [], []
+        for contact_id, name, phones, emails in batch:
+            keys.extend((key, contact_id) for key in set(blocking_keys(name, phones, emails)))
+            phones = {key for key in map(phone_block_key, phones) if key}
+            features.append((contact_id, normalize_name(name), "\n".join(phones), "\n".join(set(emails))))
+        conn.executemany("INSERT INTO dedup_keys (key, contact_id) VALUES (?, ?)", keys)
+        conn.executemany("INSERT INTO dedup_features (contact_id, name, phones, emails) VALUES (?, ?, ?, ?)", features)
+        count += len(batch)
+    conn.commit()
+    return count
+
+
+def _candidate_pairs(conn, max_block_size, max_name_block_size):
+    """
+    Returns the set of (smaller id, larger id) pairs sharing a blocking key.
+    """
+    pairs = set()
+    cursor = conn.execute("""
+        SELECT group_concat(contact_id) FROM dedup_keys
+        GROUP BY key HAVING COUNT(*) BETWEEN 2 AND (CASE WHEN key LIKE 'n:%' THEN ? ELSE ? END)
+    """, (min(max_block_size, max_name_block_size), max_block_size))
+    for (ids,) in cursor:
+        pairs.update(combinations(sorted(int(contact_id) for contact_id in ids.split(",")), 2))
+    return pairs
+
+
+def _load_features(conn, contact_ids):
+    """
+    Returns {id: (normalized name, phone keys, email keys)} for the given contacts.
+    """
+    features = {}
+    contact_ids = sorted(contact_ids)
+    for start in range(0, len(contact_ids), FEATURE_CHUNK_SIZE):
+        chunk = contact_ids[start:start + FEATURE_CHUNK_SIZE]
+        for contact_id, name, phones, emails in conn.execute(
+                f"SELECT contact_id, name, phones, emails FROM dedup_features WHERE contact_id IN ({', '.join('?' * len(chunk))})", chunk):
+            features[contact_id] = (name, frozenset(phones.split("\n")) - {""}, frozenset(emails.split("\n")) - {""})
+    return features
+
+
+def _group(pairs, features):
+    """
+    Groups linked IDs with a union-find. Each pair is (id, id, shares details).
+    Pairs sharing details are linked first; a pair matched on names alone is
+    only linked if its two groups have no conflicting phones or emails, so a
+    contact without details never chains different people together.
+    Returns sorted lists of IDs, one per group.
+    """
+    parent = {}
+    details = {}  # Root -> (phone keys, email keys) of its group
+
+    def find(item):
+        if item not in parent:
+            parent[item] = item
+            details[item] = (set(features[item][1]), set(features[item][2]))
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]  # Path halving
+            item = parent[item]
+        return item
+
+    def conflicts(first, second):
+        return any(mine and theirs and mine.isdisjoint(theirs) for mine, theirs in zip(details[first], details[second]))
+
+    for first, second, shared in sorted(pairs, key=lambda pair: (not pair[2], pair[0], pair[1])):
+        first, second = find(first), find(second)
+        if first != second and (shared or not conflicts(first, second)):
+            root, other = min(first, second), max(first, second)
+            parent[other] = root
+            for mine, theirs in zip(details[root], details.pop(other)):
+                mine |= theirs
+    groups = {}
+    for item in parent:
+        groups.setdefault(find(item), []).append(item)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+
+def find_duplicates(repository, threshold=THRESHOLD, max_block_size=MAX_BLOCK_SIZE, workers=1, batch_size=EXPORT_BATCH_SIZE,
+                    max_name_block_size=MAX_NAME_BLOCK_SIZE, merge_name_only=False):
+    """
+    Returns the groups of likely duplicate contacts as sorted lists of IDs,
+    the (id, id) pairs matched on their names alone, and the numbers of
+    contacts read and candidate pairs scored. Pairs matched on names alone
+    are left out of the groups, to be reviewed, unless `merge_name_only`;
+    then they are grouped and none are returned. With more than one worker,
+    candidates are scored on a process pool.
+    """
+    conn = sqlite3.connect("")  # Private scratch database on disk, deleted when closed
+    try:
+        count = _collect_keys(repository, conn, batch_size)
+        pairs = _candidate_pairs(conn, max_block_size, max_name_block_size)
+        features = _load_features(conn, {contact_id for pair in pairs for contact_id in pair})
+    finally:
+        conn.close()
+    scored = [(first, features[first], second, features[second]) for first, second in pairs
+              if first in features and second in features]
+    chunks = [scored[start:start + SCORE_CHUNK_SIZE] for start in range(0, len(scored), SCORE_CHUNK_SIZE)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(score_pairs, chunks, repeat(threshold)))
+    else:
+        results = [score_pairs(chunk, threshold) for chunk in chunks]
+    duplicates = [pair for result in results for pair in result]
+    if merge_name_only:
+        return _group(duplicates, features), [], count, len(scored)
+    groups = _group([pair for pair in duplicates if pair[2]], features)
+    group_of = {contact_id: index for index, group in enumerate(groups) for contact_id in group}
+    name_only = sorted((first, second) for first, second, shared in duplicates
+                       if not shared and (first not in group_of or group_of[first] != group_of.get(second)))
+    return groups, name_only, count, len(scored)
+
+
+def merge_groups(repository, groups, batch_size=MERGE_BATCH_SIZE):
+    """
+    Merges every group of duplicates into its oldest contact, like
+    merge_contact, `batch_size` duplicates per transaction.
+    Returns the number of contacts merged away.
+    """
+    rows = [(group[0], duplicate) for group in groups for duplicate in group[1:]]
+    merged = 0
+    for start in range(0, len(rows), batch_size):
+        merged += repository.merge_duplicate_many(rows[start:start + batch_size])
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and merge duplicate contacts.")
+    parser.add_argument("--db", default="contacts.db", help="Contact database to clean.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Minimum score of a duplicate pair.")
+    parser.add_argument("--max-block-size", type=int, default=MAX_BLOCK_SIZE, help="Skip keys shared by more contacts.")
+    parser.add_argument("--max-name-block-size", type=int, default=MAX_NAME_BLOCK_SIZE,
+                        help="Only match contacts on their names alone within smaller name blocks.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes scoring candidate pairs.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the groups of duplicates.")
+    parser.add_argument("--merge-name-only", action="store_true",
+                        help="Also merge contacts sharing no phone or email but a similar name, instead of listing them.")
+    args = parser.parse_args()
+
+    repository = ContactRepository(args.db)
+    groups, name_only, count, candidates = find_duplicates(repository, args.threshold, args.max_block_size, args.workers,
+                                                           max_name_block_size=args.max_name_block_size,
+                                                           merge_name_only=args.merge_name_only)
+    print(f"Read {count} contacts, scored {candidates} candidate pairs, found {len(groups)} groups of duplicates.")
+    if name_only:  # Printed before merging, which may delete one of the pair
+        print(f"{len(name_only)} pairs only share a similar name and are not merged (see --merge-name-only):")
+        for pair in name_only:
+            print(" - ".join(f"{contact_id}: {repository.get_contact(contact_id).name}" for contact_id in pair))
+    if args.dry_run:
+        for group in groups:
+            print(", ".join(f"{contact_id}: {repository.get_contact(contact_id).name}" for contact_id in group))
+    else:
+        print(f"Merged {merge_groups(repository, groups)} duplicates.")
+    repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Streaming export and online backup of the contact database.
+
+The exporters write one contact at a time as ContactRepository.iter_contacts
+reads them, so memory use stays flat whatever the size of the database.
+The CSV and JSONL output can be read back by importer.py. Run with e.g.:
+
+    python exporter.py contacts.csv
+    python exporter.py backup.db --snapshot
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+from repository import ContactRepository, EXPORT_BATCH_SIZE
+
+SNAPSHOT_PAGES = 1024  # Database pages copied per backup step
+
+
+def write_csv(contacts, file):
+    """
+    Writes contacts as CSV with the columns read by importer.read_csv.
+    Returns the number of contacts written.
+    """
+    writer = csv.writer(file)
+    writer.writerow(["id", "name", "phones", "emails", "addresses", "notes"])
+    count = 0
+    for contact in contacts:
+        writer.writerow([contact.id, contact.name, "; ".join(contact.phones), "; ".join(contact.emails),
+                         "; ".join(contact.addresses), contact.notes])
+        count += 1
+    return count
+
+
+def write_jsonl(contacts, file):
+    """
+    Writes contacts as JSON Lines, one contact per line.
+    Returns the number of contacts written.
+    """
+    count = 0
+    for contact in contacts:
+        file.write(json.dumps(contact.to_dict(), ensure_ascii=False))
+        file.write("\n")
+        count += 1
+    return count
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
+
+
+def write_vcard(contacts, file):
+    """
+    Writes contacts as vCard 3.0 cards. Each address goes in the street
+    component of ADR, as the contact store keeps it as a single string.
+    Returns the number of contacts written.
+    """
+    count = 0
+    for contact in contacts:
+        lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{_escape(contact.name)}", f"N:{_escape(contact.name)};;;;"]
+        lines += [f"TEL:{_escape(phone)}" for phone in contact.phones]
+        lines += [f"EMAIL:{_escape(email)}" for email in contact.emails]
+        lines += [f"ADR:;;{_escape(address)};;;;" for address in contact.addresses]
+        if contact.notes:
+            lines.append(f"NOTE:{_escape(contact.notes)}")
+        lines.append("END:VCARD")
+        file.write("\r\n".join(lines) + "\r\n")
+        count += 1
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "vcard": write_vcard}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".vcf": "vcard", ".vcard": "vcard"}
+
+
+def export_contacts(repository, path, file_format=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Exports every contact to `path` ("-" for standard output), guessing the
+    format from the extension unless `file_format` is given.
+    Returns the number of contacts written.
+    """
+    file_format = file_format or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if file_format not in WRITERS:
+        raise ValueError(f"Cannot tell the format of '{path}', pass one of: {', '.join(WRITERS)}")
+    contacts = repository.iter_contacts(batch_size)
+    if path == "-":
+        return WRITERS[file_format](contacts, sys.stdout)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        return WRITERS[file_format](contacts, file)
+
+
+def snapshot(conn, path, pages=SNAPSHOT_PAGES, progress=True):
+    """
+    Copies a live database to `path` with the SQLite online backup API,
+    `pages` pages at a time. Other connections can read and write between
+    steps; if they do, the copy restarts so the snapshot stays consistent.
+    """
+    def report(status, remaining, total):
+        if progress:
+            print(f"Copied {total - remaining} of {total} pages")
+
+    destination = sqlite3.connect(path)
+    try:
+        conn.backup(destination, pages=pages, progress=report)
+    finally:
+        destination.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the contact database or take a snapshot of it.")
+    parser.add_argument("path", help="Output file, or '-' for standard output.")
+    parser.add_argument("--format", choices=WRITERS, help="Format of the output (default: from its extension).")
+    parser.add_argument("--db", default="contacts.db", help="Contact database to export.")
+    parser.add_argument("--snapshot", action="store_true", help="Copy the whole database file instead of exporting contacts.")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Contacts read per query.")
+    args = parser.parse_args()
+
+    repository = ContactRepository(args.db)
+    if args.snapshot:
+        snapshot(repository.conn, args.path)
+        print(f"Snapshot of '{args.db}' written to '{args.path}'.")
+    else:
+        count = export_contacts(repository, args.path, args.format, args.batch_size)
+        if args.path != "-":
+            print(f"Exported {count} contacts to '{args.path}'.")
+
+
+if __name__ == "__main__":
+    main()
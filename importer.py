@@ -0,0 +1,141 @@
+"""
+Bulk import of contacts from CSV, vCard and JSONL files.
+
+Every reader is a generator yielding one record dict at a time, so files of
+any size are imported in constant memory by ContactRepository.bulk_import.
+Run with e.g.:
+
+    python importer.py export.csv --on-duplicate merge
+"""
+import argparse
+import csv
+import json
+import os
+import re
+
+from repository import ContactRepository, DUPLICATE_POLICIES, IMPORT_BATCH_SIZE
+
+
+def read_csv(path):
+    """
+    Yields the records of a CSV file with a header row naming the columns
+    name, phones, emails, addresses and notes. Several phones, emails or
+    addresses in one cell are separated by ';'.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            yield {
+                "name": row.get("name", ""),
+                "phones": row.get("phones", ""),
+                "emails": row.get("emails", ""),
+                "addresses": row.get("addresses", ""),
+                "notes": row.get("notes", ""),
+            }
+
+
+def read_jsonl(path):
+    """
+    Yields the records of a JSON Lines file, one JSON object per line with the
+    keys name, phones, emails, addresses and notes. Blank lines are ignored.
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _unfold_lines(file):
+    """
+    Yields the logical lines of a vCard file, joining folded continuation lines.
+    """
+    current = None
+    for line in file:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+UNESCAPED = {"n": "\n", "N": "\n"}  # vCard escapes standing for another character; others stand for themselves
+
+
+def _unescape(value):
+    # One left-to-right pass, so an escaped backslash is never read as the start of another escape
+    return re.sub(r"\\(.)", lambda match: UNESCAPED.get(match.group(1), match.group(1)), value)
+
+
+def read_vcard(path):
+    """
+    Yields the records of a vCard (.vcf) file, reading the FN (or N), TEL,
+    EMAIL, ADR and NOTE properties of every card.
+    """
+    with open(path, encoding="utf-8") as file:
+        record = None
+        for line in _unfold_lines(file):
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            prop = key.split(";", 1)[0].split(".")[-1].upper()  # Drops parameters and group prefixes
+            if prop == "BEGIN" and value.upper() == "VCARD":
+                record = {"name": "", "phones": [], "emails": [], "addresses": [], "notes": ""}
+            elif record is None:
+                continue
+            elif prop == "END":
+                yield record
+                record = None
+            elif prop == "FN":
+                record["name"] = _unescape(value)
+            elif prop == "N" and not record["name"]:
+                parts = [_unescape(part) for part in value.split(";")]
+                record["name"] = " ".join(part for part in parts[1:2] + parts[:1] if part)
+            elif prop == "TEL":
+                record["phones"].append(_unescape(value))
+            elif prop == "EMAIL":
+                record["emails"].append(_unescape(value))
+            elif prop == "ADR":
+                parts = [_unescape(part).strip() for part in value.split(";")]
+                record["addresses"].append(", ".join(part for part in parts if part))
+            elif prop == "NOTE":
+                record["notes"] = _unescape(value)
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "vcard": read_vcard}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".vcf": "vcard", ".vcard": "vcard"}
+
+
+def read_records(path, file_format=None):
+    """
+    Returns a generator over the records of a file, guessing its format from
+    the extension unless `file_format` is given.
+    """
+    file_format = file_format or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if file_format not in READERS:
+        raise ValueError(f"Cannot tell the format of '{path}', pass one of: {', '.join(READERS)}")
+    return READERS[file_format](path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import contacts from a CSV, vCard or JSONL file.")
+    parser.add_argument("path", help="File to import.")
+    parser.add_argument("--format", choices=READERS, help="Format of the file (default: from its extension).")
+    parser.add_argument("--db", default="contacts.db", help="Contact database to import into.")
+    parser.add_argument("--on-duplicate", choices=DUPLICATE_POLICIES, default="skip",
+                        help="What to do with a record whose name already exists.")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Records written per batch.")
+    args = parser.parse_args()
+
+    def report(done, rate):
+        print(f"Imported {done} records ({rate:.0f} records/s)")
+
+    repository = ContactRepository(args.db)
+    counts = repository.bulk_import(read_records(args.path, args.format), args.on_duplicate, args.batch_size, report)
+    print(f"Done: {counts['added']} added, {counts['merged']} merged, {counts['skipped']} skipped.")
+
+
+if __name__ == "__main__":
+    main()
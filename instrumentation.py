@@ -0,0 +1,210 @@
+"""
+Opt-in profiling of the contact database.
+
+An Instrumentation object passed to ContactRepository (or ContactManager)
+records, per logical operation (list, inspect, add, merge, search, edit, ...),
+the number of calls, a latency histogram, the rows returned or changed and
+the SQL statements run. It hooks every pooled connection with
+set_trace_callback and a progress handler, and flags statements running
+longer than `slow_ms`. Stats can be dumped as JSON or Prometheus text:
+
+    instrumentation = Instrumentation(slow_ms=50)
+    manager = ContactManager(instrumentation=instrumentation)
+    ...
+    instrumentation.dump("stats.prom", "prometheus")
+
+Without an Instrumentation the repository installs no hooks, and each
+instrumented method only checks that `self.instrumentation` is None.
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # Upper bounds of the latency histogram
+SLOW_MS = 100  # Statements running longer are flagged as slow
+SLOW_LOG_SIZE = 100  # Number of slow statements kept
+PROGRESS_STEPS = 1000  # SQLite instructions between two checks for slow statements
+SQL_PREVIEW = 200  # Characters of SQL kept per slow statement
+FORMATS = ("json", "prometheus")
+
+
+def instrumented(operation, rows=None):
+    """
+    Decorates a repository method so that its calls are recorded under
+    `operation`. `rows` maps the result to the number of rows returned or
+    changed; by default the result is that number.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.instrumentation is None:
+                return method(self, *args, **kwargs)
+            with self.instrumentation.operation(operation) as record:
+                result = method(self, *args, **kwargs)
+                record["rows"] += rows(result) if rows else int(result or 0)
+            return result
+        return wrapper
+    return decorate
+
+
+class Instrumentation:
+    """
+    Per-operation call counts, latency histograms, row counts and statement
+    counts, and a log of slow statements. Thread-safe.
+    """
+
+    def __init__(self, slow_ms=SLOW_MS, clock=time.perf_counter):
+        self.slow_ms = slow_ms
+        self.clock = clock
+        self.stats = {}  # operation -> counters, see _stats_of
+        self.slow_statements = deque(maxlen=SLOW_LOG_SIZE)
+        self.slow_count = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()  # Stack of running operations and current statement of each thread
+
+    def _stats_of(self, operation):
+        stats = self.stats.get(operation)
+        if stats is None:
+            stats = self.stats[operation] = {"calls": 0, "errors": 0, "seconds": 0.0, "rows": 0, "statements": 0,
+                                             "buckets": [0] * (len(BUCKETS_MS) + 1)}
+        return stats
+
+    def attach(self, conn):
+        """
+        Hooks a connection, so its statements are counted and slow ones flagged.
+        """
+        conn.set_trace_callback(self._trace)
+        conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _trace(self, sql):
+        if sql.startswith("--"):  # Statements of a trigger, already part of the statement firing it
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1]["statements"] += 1
+        self._local.statement = [sql, self.clock(), False]  # SQL, start time, flagged as slow
+
+    def _progress(self, *args):
+        statement = getattr(self._local, "statement", None)
+        if statement is not None and not statement[2]:
+            elapsed_ms = (self.clock() - statement[1]) * 1000
+            if elapsed_ms >= self.slow_ms:
+                statement[2] = True
+                stack = self._stack()
+                with self.lock:
+                    self.slow_count += 1
+                    self.slow_statements.append({"operation": stack[-1]["operation"] if stack else None,
+                                                 "sql": " ".join(statement[0].split())[:SQL_PREVIEW],
+                                                 "elapsed_ms": round(elapsed_ms, 3)})
+        return 0  # Never interrupts the statement
+
+    def operation(self, name):
+        """
+        Returns a context manager recording one call of the operation `name`.
+        It yields a dict whose "rows" count the caller may increase.
+        """
+        return _Operation(self, name)
+
+    def _record(self, record, seconds, failed):
+        elapsed_ms = seconds * 1000
+        bucket = next((index for index, bound in enumerate(BUCKETS_MS) if elapsed_ms <= bound), len(BUCKETS_MS))
+        with self.lock:
+            stats = self._stats_of(record["operation"])
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["seconds"] += seconds
+            stats["rows"] += record["rows"]
+            stats["statements"] += record["statements"]
+            stats["buckets"][bucket] += 1
+
+    def snapshot(self):
+        """
+        Returns every stat as a JSON-serializable dict.
+        """
+        with self.lock:
+            operations = {}
+            for operation, stats in sorted(self.stats.items()):
+                operations[operation] = {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "total_ms": round(stats["seconds"] * 1000, 3),
+                    "mean_ms": round(stats["seconds"] * 1000 / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "rows": stats["rows"],
+                    "statements": stats["statements"],
+                    "histogram_ms": {str(bound): count for bound, count in zip(BUCKETS_MS + ("+Inf",), stats["buckets"])},
+                }
+            return {"slow_ms": self.slow_ms, "operations": operations,
+                    "slow_statements": self.slow_count, "slow_log": list(self.slow_statements)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns the stats in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP contacts_operation_seconds Latency of contact operations.",
+            "# TYPE contacts_operation_seconds histogram",
+        ]
+        with self.lock:
+            stats_items = sorted(self.stats.items())
+            for operation, stats in stats_items:
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS + (None,), stats["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound is None else repr(bound / 1000)
+                    lines.append(f'contacts_operation_seconds_bucket{{operation="{operation}",le="{le}"}} {cumulative}')
+                lines.append(f'contacts_operation_seconds_sum{{operation="{operation}"}} {stats["seconds"]}')
+                lines.append(f'contacts_operation_seconds_count{{operation="{operation}"}} {stats["calls"]}')
+            for name, description in (("errors", "Contact operations that raised."),
+                                      ("rows", "Rows returned or changed by contact operations."),
+                                      ("statements", "SQL statements run by contact operations.")):
+                lines.append(f"# HELP contacts_operation_{name}_total {description}")
+                lines.append(f"# TYPE contacts_operation_{name}_total counter")
+                for operation, stats in stats_items:
+                    lines.append(f'contacts_operation_{name}_total{{operation="{operation}"}} {stats[name]}')
+            lines += [
+                f"# HELP contacts_slow_statements_total SQL statements running longer than {self.slow_ms} ms.",
+                "# TYPE contacts_slow_statements_total counter",
+                f"contacts_slow_statements_total {self.slow_count}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, file_format="json"):
+        """
+        Writes the stats to `path` as JSON or Prometheus text.
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Invalid format '{file_format}'. Choose from: {', '.join(FORMATS)}.")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.to_json() + "\n" if file_format == "json" else self.to_prometheus())
+
+
+class _Operation:
+    """
+    Context manager timing one call of an operation, see Instrumentation.operation.
+    """
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.record = {"operation": name, "rows": 0, "statements": 0}
+
+    def __enter__(self):
+        self.instrumentation._stack().append(self.record)
+        self.start = self.instrumentation.clock()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = self.instrumentation.clock() - self.start
+        self.instrumentation._stack().pop()
+        self.instrumentation._record(self.record, seconds, exc_type is not None)
+        return False
@@ -0,0 +1,92 @@
+from repository import PAGE_SIZE
+
+ORDERS = ("id", "name")
+
+
+class ContactListView:
+    """
+    One screen of the contact list, for the main menu. Only the page on
+    screen is kept in memory; the next one is fetched on demand by keyset
+    pagination, ordered by ID or by name, so drawing a page costs the same
+    whatever the size of the database. The page is read again only when
+    the database changed since it was last read.
+    """
+
+    def __init__(self, repository, page_size=PAGE_SIZE):
+        self.repository = repository
+        self.page_size = page_size
+        self.order = "id"
+        self.cursors = [None]  # Cursor of every page visited so far, the last one is on screen
+        self.rows = []
+        self.next_cursor = None
+        self.version = None  # Change counter of the database when the page was read
+
+    def _fetch(self, after):
+        if self.order == "name":
+            return self.repository.list_contacts_by_name(after, self.page_size)
+        return self.repository.list_contacts(after, self.page_size)
+
+    def refresh(self, force=False):
+        """
+        Reads the page on screen again if the database changed since it was read.
+        Falls back to the first page if the page emptied out.
+        """
+        version = self.repository.change_counter()
+        if not force and version == self.version:
+            return
+        self.rows, self.next_cursor = self._fetch(self.cursors[-1])
+        if not self.rows and len(self.cursors) > 1:
+            self.cursors = [None]
+            self.rows, self.next_cursor = self._fetch(None)
+        self.version = version
+
+    def draw(self):
+        """
+        Prints the page on screen, refreshing it first if needed.
+        Returns the number of contacts shown.
+        """
+        self.refresh()
+        for contact_id, name, phones in self.rows:
+            print(f"ID: {contact_id}, Name: {name}, Phone(s): {phones or ''}")
+        if self.rows:
+            print(f"-- Page {self.page_number} (by {self.order}) --")
+        return len(self.rows)
+
+    @property
+    def page_number(self):
+        return len(self.cursors)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return len(self.cursors) > 1
+
+    def next_page(self):
+        if self.has_next():
+            self.cursors.append(self.next_cursor)
+            self.refresh(force=True)
+
+    def previous_page(self):
+        if self.has_previous():
+            self.cursors.pop()
+            self.refresh(force=True)
+
+    def set_order(self, order):
+        """
+        Orders the list by "id" or "name", starting over from the first page.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Invalid order '{order}'. Choose from: {', '.join(ORDERS)}.")
+        self.order = order
+        self.cursors = [None]
+        self.refresh(force=True)
+
+    def jump_to(self, prefix):
+        """
+        Orders the list by name and shows the page starting at the first name
+        not sorting before `prefix`, ignoring case, found by a seek in the name index.
+        """
+        self.order = "name"
+        self.cursors = [None, (prefix, 0)] if prefix else [None]
+        self.refresh(force=True)
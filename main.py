@@ -1,16 +1,23 @@
+import argparse
+
 from contact_manager import ContactManager
-from utils import special_input, ReturnToMainMenu, ReturnToPreviousStep
+from instrumentation import Instrumentation, FORMATS, SLOW_MS
+from list_view import ContactListView
+from sharding import ShardedContactManager
+from utils import clean_values, special_input, ReturnToMainMenu, ReturnToPreviousStep
 
-if __name__ == "__main__":
-    manager = ContactManager()
+def run(manager):
+    """
+    Runs the interactive menu until the user exits.
+    """
+    view = ContactListView(manager)  # One screen of the list, read again only after a change
 
     while True:
         try:
             # Display the contact list as the default interface
             print("\n--- Contact List ---")
             try:
-                contacts = manager.show_all_contacts()  # Get all contacts
-                if not contacts:
+                if not view.draw():  # Draw the current page
                     print("No contacts found. You can add a new contact.")
 
             except Exception as e:
@@ -23,6 +30,12 @@ if __name__ == "__main__":
             print("2. Add New Contact")
             print("3. Search for a Contact")
             print("4. Exit")
+            if view.has_next():
+                print("N. Next Page")
+            if view.has_previous():
+                print("P. Previous Page")
+            print("O. Order by " + ("ID" if view.order == "name" else "Name"))
+            print("J. Jump to Name")
 
             action_choice = special_input("Enter your choice: ", step="action_menu")
 
@@ -39,9 +52,9 @@ if __name__ == "__main__":
             elif action_choice == "2":  # Add New Contact
                 try:
                     name = special_input("Enter name: ", step="add_name")
-                    phones = special_input("Enter phone(s) (comma-separated): ", step="add_phones").split(",")
-                    emails = special_input("Enter email(s) (comma-separated): ", step="add_emails").split(",")
-                    addresses = special_input("Enter address(es) (comma-separated): ", step="add_addresses").split(",")
+                    phones = clean_values(special_input("Enter phone(s) (comma-separated): ", step="add_phones").split(","))
+                    emails = clean_values(special_input("Enter email(s) (comma-separated): ", step="add_emails").split(","))
+                    addresses = clean_values(special_input("Enter address(es) (comma-separated): ", step="add_addresses").split(","))
                     notes = special_input("Enter notes: ", step="add_notes")
                     manager.add_contact(name, phones, emails, addresses, notes)
                 except ReturnToPreviousStep:
@@ -65,8 +78,46 @@ if __name__ == "__main__":
                 print("Exiting Contact Manager. Goodbye!")
                 break
 
+            elif action_choice.lower() == "n" and view.has_next():  # Next Page
+                view.next_page()
+
+            elif action_choice.lower() == "p" and view.has_previous():  # Previous Page
+                view.previous_page()
+
+            elif action_choice.lower() == "o":  # Toggle the order of the list
+                view.set_order("id" if view.order == "name" else "name")
+
+            elif action_choice.lower() == "j":  # Jump to a name
+                try:
+                    prefix = special_input("Enter the first letters of the name: ", step="jump_name")
+                    view.jump_to(prefix.strip())
+                except ReturnToPreviousStep:
+                    continue
+
             else:
                 print("Invalid choice. Please try again.")
 
         except ReturnToMainMenu:
             continue  # Restart the main interface
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interactive contact manager.")
+    parser.add_argument("--db", default="contacts.db", help="Contact database to open.")
+    parser.add_argument("--shards", nargs="+", help="Open these shard files, in order, instead of --db.")
+    parser.add_argument("--stats", help="Record the time and queries of every operation, and write them to this file on exit.")
+    parser.add_argument("--stats-format", choices=FORMATS, default="json", help="Format of the stats file.")
+    parser.add_argument("--slow-ms", type=float, default=SLOW_MS, help="Statements running longer are logged as slow.")
+    args = parser.parse_args()
+
+    instrumentation = Instrumentation(args.slow_ms) if args.stats else None
+    if args.shards:
+        manager = ShardedContactManager(args.shards, instrumentation=instrumentation)
+    else:
+        manager = ContactManager(args.db, instrumentation=instrumentation)
+    try:
+        run(manager)
+    finally:
+        if instrumentation is not None:
+            instrumentation.dump(args.stats, args.stats_format)
+            print(f"Stats written to '{args.stats}'.")
+        manager.close()
@@ -0,0 +1,388 @@
+"""
+Versioned schema migrations for the contact database.
+
+Every migration upgrades the schema by exactly one version. The version a
+database has reached is stored in `PRAGMA user_version`, so opening an older
+contacts.db upgrades it in place and opening an up-to-date one does nothing.
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+"""
+
+# Strips the usual separators from a phone number inside SQL, e.g. "+84 (912) 345-678" -> "84912345678"
+PHONE_DIGITS_SQL = "replace(replace(replace(replace(replace(replace(replace({0}, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', '')"
+
+# Rebuilds the full-text row of one contact from its current name, notes, emails and addresses
+REFRESH_CONTACT_FTS_SQL = """
+    DELETE FROM contacts_fts WHERE rowid = {0};
+    INSERT INTO contacts_fts (rowid, name, notes, emails, addresses)
+        SELECT id, name, notes,
+               (SELECT GROUP_CONCAT(email, ' ') FROM emails WHERE contact_id = contacts.id),
+               (SELECT GROUP_CONCAT(address, ' ') FROM addresses WHERE contact_id = contacts.id)
+        FROM contacts WHERE id = {0};
+"""
+
+# (table, value column) of every table holding a list of values per contact
+CHILD_TABLES = (("phones", "phone"), ("emails", "email"), ("addresses", "address"))
+
+CONTACT_ID_RANGE = 1000000000  # Contact IDs allocated to each node, see allocate_contact_ids
+# The ID before a random range of contact IDs, below 2**53 so that they stay exact in JSON for any reader
+RANDOM_CONTACT_ID_RANGE_SQL = f"(abs(random()) % 999999 + 1) * {CONTACT_ID_RANGE}"
+
+
+def create_base_tables(cursor):
+    """
+    Version 1: the contacts, phones, emails and addresses tables.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            notes TEXT
+        );
+    """)
+    for table, column in CHILD_TABLES:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                contact_id INTEGER NOT NULL,
+                {column} TEXT NOT NULL,
+                FOREIGN KEY (contact_id) REFERENCES contacts (id)
+            );
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_contact_id ON {table} (contact_id);")
+
+
+def create_search_index(cursor):
+    """
+    Version 2: an FTS5 table over name, notes, emails and addresses, and a
+    trigram index over the digits of every phone number. Both are kept in
+    sync by triggers and filled from the existing rows.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('contacts_fts', 'phones_fts')")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    if "contacts_fts" not in existing:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE contacts_fts USING fts5(
+                name, notes, emails, addresses,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+        """)
+        cursor.execute("""
+            INSERT INTO contacts_fts (rowid, name, notes, emails, addresses)
+            SELECT id, name, notes,
+                   (SELECT GROUP_CONCAT(email, ' ') FROM emails WHERE contact_id = contacts.id),
+                   (SELECT GROUP_CONCAT(address, ' ') FROM addresses WHERE contact_id = contacts.id)
+            FROM contacts;
+        """)
+    if "phones_fts" not in existing:
+        cursor.execute("CREATE VIRTUAL TABLE phones_fts USING fts5(digits, contact_id UNINDEXED, tokenize = 'trigram');")
+        cursor.execute(f"INSERT INTO phones_fts (rowid, digits, contact_id) SELECT id, {PHONE_DIGITS_SQL.format('phone')}, contact_id FROM phones;")
+
+    refresh_new = REFRESH_CONTACT_FTS_SQL.format("NEW.contact_id")
+    refresh_old = REFRESH_CONTACT_FTS_SQL.format("OLD.contact_id")
+    triggers = [
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+                {REFRESH_CONTACT_FTS_SQL.format("NEW.id")}
+            END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+                DELETE FROM contacts_fts WHERE rowid = OLD.id;
+                {REFRESH_CONTACT_FTS_SQL.format("NEW.id")}
+            END;""",
+        """CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+                DELETE FROM contacts_fts WHERE rowid = OLD.id;
+            END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS phones_fts_insert AFTER INSERT ON phones BEGIN
+                INSERT INTO phones_fts (rowid, digits, contact_id) VALUES (NEW.id, {PHONE_DIGITS_SQL.format("NEW.phone")}, NEW.contact_id);
+            END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS phones_fts_update AFTER UPDATE ON phones BEGIN
+                DELETE FROM phones_fts WHERE rowid = OLD.id;
+                INSERT INTO phones_fts (rowid, digits, contact_id) VALUES (NEW.id, {PHONE_DIGITS_SQL.format("NEW.phone")}, NEW.contact_id);
+            END;""",
+        """CREATE TRIGGER IF NOT EXISTS phones_fts_delete AFTER DELETE ON phones BEGIN
+                DELETE FROM phones_fts WHERE rowid = OLD.id;
+            END;""",
+    ]
+    for table in ("emails", "addresses"):
+        triggers += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {refresh_new} END;",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN {refresh_old} {refresh_new} END;",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN {refresh_old} END;",
+        ]
+    for trigger in triggers:
+        cursor.execute(trigger)
+
+
+def add_unique_indexes(cursor):
+    """
+    Version 3: removes duplicate values of a contact, then replaces the plain
+    contact_id indexes by UNIQUE covering indexes on (contact_id, value) so
+    that INSERT OR IGNORE deduplicates, and indexes contacts by name for the
+    duplicate check of add_contact.
+    """
+    for table, column in CHILD_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY contact_id, {column});")
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_contact_{column} ON {table} (contact_id, {column});")
+        cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_contact_id;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contacts_name ON contacts (name);")
+
+
+def batch_friendly_search_triggers(cursor):
+    """
+    Version 4: a new contact is indexed with a single insert instead of a
+    delete and a re-insert, and an email or address written before its contact
+    exists (as bulk_import does) is left to the contact's trigger, so every
+    imported contact is indexed once with all of its values.
+    """
+    for table in ("emails", "addresses"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_insert;")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table}
+            WHEN EXISTS (SELECT 1 FROM contacts WHERE id = NEW.contact_id) BEGIN
+                {REFRESH_CONTACT_FTS_SQL.format("NEW.contact_id")}
+            END;
+        """)
+    cursor.execute("DROP TRIGGER IF EXISTS contacts_fts_insert;")
+    cursor.execute("""
+        CREATE TRIGGER contacts_fts_insert AFTER INSERT ON contacts BEGIN
+            INSERT INTO contacts_fts (rowid, name, notes, emails, addresses)
+            VALUES (NEW.id, NEW.name, NEW.notes,
+                    (SELECT GROUP_CONCAT(email, ' ') FROM emails WHERE contact_id = NEW.id),
+                    (SELECT GROUP_CONCAT(address, ' ') FROM addresses WHERE contact_id = NEW.id));
+        END;
+    """)
+
+
+def create_change_log(cursor):
+    """
+    Version 5: an append-only log of every row inserted, updated or deleted
+    in contacts, phones, emails and addresses, numbered by an increasing
+    sequence, for sync.py. Existing rows are logged as inserts, so a new node
+    can sync from sequence 0. sync_peers holds the last sequence applied from
+    every other node, and sync_node the random ID of this one.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D')),
+            row_id INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS sync_peers (node_id TEXT PRIMARY KEY, last_seq INTEGER NOT NULL);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS sync_node (node_id TEXT NOT NULL);")
+    cursor.execute("INSERT INTO sync_node (node_id) SELECT lower(hex(randomblob(8))) WHERE NOT EXISTS (SELECT 1 FROM sync_node);")
+    for table in ("contacts",) + tuple(table for table, column in CHILD_TABLES):
+        cursor.execute(f"INSERT INTO change_log (table_name, op, row_id) SELECT '{table}', 'I', id FROM {table} ORDER BY id;")
+        for event, op, row in (("INSERT", "I", "NEW"), ("UPDATE", "U", "NEW"), ("DELETE", "D", "OLD")):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_log_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_log (table_name, op, row_id) VALUES ('{table}', '{op}', {row}.id);
+                END;
+            """)
+
+
+def add_lookup_keys(cursor):
+    """
+    Version 6: phones get a canonical phone_key and emails a lowercased
+    email_key (see utils.phone_key and utils.email_key), both indexed, so
+    finding whose number or address something is takes an index seek.
+    Existing rows are filled in by backfill.py. The search index triggers
+    now only fire when the displayed value changes, not its key.
+    """
+    for table, column, key in (("phones", "phone", "phone_key"), ("emails", "email", "email_key")):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {key} TEXT;")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table} ({key});")
+    cursor.execute("DROP TRIGGER IF EXISTS phones_fts_update;")
+    cursor.execute(f"""
+        CREATE TRIGGER phones_fts_update AFTER UPDATE OF phone, contact_id ON phones BEGIN
+            DELETE FROM phones_fts WHERE rowid = OLD.id;
+            INSERT INTO phones_fts (rowid, digits, contact_id) VALUES (NEW.id, {PHONE_DIGITS_SQL.format("NEW.phone")}, NEW.contact_id);
+        END;
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS emails_fts_update;")
+    cursor.execute(f"""
+        CREATE TRIGGER emails_fts_update AFTER UPDATE OF email, contact_id ON emails BEGIN
+            {REFRESH_CONTACT_FTS_SQL.format("OLD.contact_id")}
+            {REFRESH_CONTACT_FTS_SQL.format("NEW.contact_id")}
+        END;
+    """)
+
+
+def index_names_case_insensitively(cursor):
+    """
+    Version 7: indexes contact names with the NOCASE collation as well, so
+    the contact list is ordered, and jumped into by prefix, regardless of
+    case. idx_contacts_name stays for the exact duplicate check.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contacts_name_nocase ON contacts (name COLLATE NOCASE);")
+
+
+def log_child_values(cursor):
+    """
+    Version 8: the change log records the contact and the value of every
+    phone, email and address changed, so sync.py replicates them by
+    (contact_id, value) instead of by their IDs, which every node numbers
+    on its own. Updating a value is logged as removing the old one and
+    adding the new one. Values deleted before this version cannot be
+    recovered, and their entries are left out of sync.
+    """
+    cursor.execute("ALTER TABLE change_log ADD COLUMN contact_id INTEGER;")
+    cursor.execute("ALTER TABLE change_log ADD COLUMN value TEXT;")
+    for table, column in CHILD_TABLES:
+        cursor.execute(f"""
+            UPDATE change_log SET (contact_id, value) = (SELECT contact_id, {column} FROM {table} WHERE id = change_log.row_id)
+            WHERE table_name = '{table}';
+        """)
+        for event in ("insert", "update", "delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_log_{event};")
+        log_sql = f"INSERT INTO change_log (table_name, op, row_id, contact_id, value) VALUES ('{table}', '{{0}}', {{1}}.id, {{1}}.contact_id, {{1}}.{column});"
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_log_insert AFTER INSERT ON {table} BEGIN
+                {log_sql.format("I", "NEW")}
+            END;
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_log_update AFTER UPDATE OF contact_id, {column} ON {table} BEGIN
+                {log_sql.format("D", "OLD")}
+                {log_sql.format("I", "NEW")}
+            END;
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_log_delete AFTER DELETE ON {table} BEGIN
+                {log_sql.format("D", "OLD")}
+            END;
+        """)
+
+
+def _phone_key_v9(phone):
+    """
+    utils.phone_key as of version 9, frozen so that this migration never
+    changes: later changes to the keys need a migration of their own.
+    """
+    phone = phone.strip()
+    digits = "".join(char for char in phone if char.isdigit())
+    if not digits:
+        return None
+    if not phone.startswith("+"):
+        if digits.startswith("00"):
+            digits = digits[2:]
+        elif digits.startswith("0"):
+            digits = "84" + digits[1:]
+        elif len(digits) <= 10:
+            digits = "84" + digits
+    return "+" + digits
+
+
+def rekey_national_phones(cursor):
+    """
+    Version 9: national numbers written without a trunk "0", e.g. "912345678",
+    were keyed as international ones ("+912345678"). Recomputes the keys
+    computed so far.
+    """
+    cursor.connection.create_function("canonical_phone", 1, _phone_key_v9, deterministic=True)
+    cursor.execute("""
+        UPDATE phones SET phone_key = canonical_phone(phone)
+        WHERE phone_key IS NOT NULL AND phone_key IS NOT canonical_phone(phone);
+    """)
+
+
+def unique_lookup_keys(cursor):
+    """
+    Version 10: a contact has each phone and email once whatever its spelling:
+    removes the values whose key the contact already has, then makes
+    (contact_id, key) UNIQUE, so INSERT OR IGNORE skips "+84 912-345-678"
+    for a contact with "0912 345 678". Values still without a key are
+    deduplicated when backfill.py computes it.
+    """
+    for table, key in (("phones", "phone_key"), ("emails", "email_key")):
+        cursor.execute(f"""
+            DELETE FROM {table} WHERE {key} IS NOT NULL
+            AND id NOT IN (SELECT MIN(id) FROM {table} WHERE {key} IS NOT NULL GROUP BY contact_id, {key});
+        """)
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_contact_{key} ON {table} (contact_id, {key});")
+
+
+def index_search_prefixes(cursor):
+    """
+    Version 11: rebuilds contacts_fts with prefix indexes for words of 1 to 6
+    characters. A prefix search such as "hoang"* then reads one doclist,
+    stopping after the rows it needs, instead of merging the doclists of
+    every word starting with it ("hoang", "hoang1234", ...) first. The
+    triggers refer to the table by name and keep working.
+    """
+    cursor.execute("DROP TABLE IF EXISTS contacts_fts;")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE contacts_fts USING fts5(
+            name, notes, emails, addresses,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '1 2 3 4 5 6'
+        );
+    """)
+    cursor.execute("""
+        INSERT INTO contacts_fts (rowid, name, notes, emails, addresses)
+        SELECT id, name, notes,
+               (SELECT GROUP_CONCAT(email, ' ') FROM emails WHERE contact_id = contacts.id),
+               (SELECT GROUP_CONCAT(address, ' ') FROM addresses WHERE contact_id = contacts.id)
+        FROM contacts;
+    """)
+
+
+def allocate_contact_ids(cursor):
+    """
+    Version 12: every node allocates new contact IDs from its own range of
+    CONTACT_ID_RANGE IDs, picked at random, so contacts added independently
+    on two nodes get different IDs. sync_node holds the ID before the range
+    and the last ID of the range used so far, and sync_ranges the node
+    owning every range seen, for sync.py to refuse a contact whose range
+    belongs to another node. Existing contacts keep their IDs.
+    """
+    cursor.execute("ALTER TABLE sync_node ADD COLUMN first_contact_id INTEGER NOT NULL DEFAULT 0;")
+    cursor.execute("ALTER TABLE sync_node ADD COLUMN last_contact_id INTEGER NOT NULL DEFAULT 0;")
+    cursor.execute(f"UPDATE sync_node SET first_contact_id = {RANDOM_CONTACT_ID_RANGE_SQL};")
+    cursor.execute("UPDATE sync_node SET last_contact_id = first_contact_id;")
+    cursor.execute("CREATE TABLE IF NOT EXISTS sync_ranges (first_contact_id INTEGER PRIMARY KEY, node_id TEXT NOT NULL);")
+    cursor.execute("INSERT INTO sync_ranges (first_contact_id, node_id) SELECT first_contact_id, node_id FROM sync_node;")
+
+
+MIGRATIONS = [
+    create_base_tables,
+    create_search_index,
+    add_unique_indexes,
+    batch_friendly_search_triggers,
+    create_change_log,
+    add_lookup_keys,
+    index_names_case_insensitively,
+    log_child_values,
+    rekey_national_phones,
+    unique_lookup_keys,
+    index_search_prefixes,
+    allocate_contact_ids,
+]
+
+
+def schema_version(conn):
+    """
+    Returns the schema version the database has reached.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies every migration the database hasn't reached yet, each one in its
+    own transaction together with the version bump, and returns the final version.
+    """
+    version = schema_version(conn)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        version = number
+    return version
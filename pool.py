@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+
+BUSY_TIMEOUT = 5.0  # Seconds a connection waits for a lock held by another connection before failing
+CACHE_SIZE_KB = 16384  # Page cache of every connection
+MEMORY_DATABASE = ":memory:"
+
+
+class ConnectionPool:
+    """
+    Connections to one SQLite database, shared by the threads of a process.
+    There is a single writer connection, and writes are serialized through
+    `write_lock`. Every thread reads through its own read-only connection,
+    opened on first use. The database is put in WAL mode, so readers never
+    block the writer nor wait for it.
+
+    An in-memory database cannot be opened twice, so there every read goes
+    through the writer connection.
+
+    `on_connect`, if given, is called with every connection once it is open.
+    """
+
+    def __init__(self, db_name, busy_timeout=BUSY_TIMEOUT, cache_size_kb=CACHE_SIZE_KB, on_connect=None):
+        self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.on_connect = on_connect
+        self.write_lock = threading.RLock()
+        self.writer = self._connect(db_name)
+        if db_name != MEMORY_DATABASE:
+            self.writer.execute("PRAGMA journal_mode = WAL")
+            self.writer.execute("PRAGMA synchronous = NORMAL")  # Durable at checkpoints, safe against corruption in WAL mode
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self, database, uri=False):
+        conn = sqlite3.connect(database, timeout=self.busy_timeout, check_same_thread=False, uri=uri)
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_kb}")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def reader(self):
+        """
+        Returns the read-only connection of the calling thread.
+        """
+        if self.db_name == MEMORY_DATABASE:
+            return self.writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            path = os.path.abspath(self.db_name).replace("?", "%3f").replace("#", "%23")
+            conn = self._connect(f"file:{path}?mode=ro", uri=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self):
+        """
+        Closes the writer and every reader connection.
+        """
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self.write_lock:
+            self.writer.close()
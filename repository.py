@@ -0,0 +1,780 @@
+"""
+Headless data access to the contact database.
+
+ContactRepository holds every read and write of contacts and never prints
+or prompts, so it can be used from scripts, services and benchmarks. The
+interactive ContactManager in contact_manager.py is built on top of it.
+"""
+import time
+from itertools import islice
+
+from cache import LRUCache
+from contact import ContactBatch, FrozenContact
+from instrumentation import instrumented
+from migrations import migrate
+from pool import ConnectionPool
+from utils import clean_values, email_key, phone_key
+
+PAGE_SIZE = 50  # Number of contacts returned per page by list_contacts
+SEARCH_LIMIT = 50  # Maximum number of contacts returned by a search
+SEARCH_CATEGORIES = ("name", "phone", "email", "address", "all")
+SEARCH_COLUMNS = {"name": "name", "email": "emails", "address": "addresses", "all": None}  # Full-text column per category
+SEARCH_RANK_LIMIT = 1000  # Matches of a search word beyond which results come in ID order instead of ranked
+MIN_PHONE_DIGITS = 3  # Digits a phone search needs, the length of a trigram
+EXPORT_BATCH_SIZE = 1000  # Number of contacts read per query by iter_contacts
+CACHE_SIZE = 1024  # Number of contacts kept in memory by get_contact
+IMPORT_BATCH_SIZE = 10000  # Number of records written per executemany batch by bulk_import
+DUPLICATE_POLICIES = ("skip", "merge", "create")
+VALUE_TABLES = {  # table -> (value column, lookup key column, function computing the key)
+    "phones": ("phone", "phone_key", phone_key),
+    "emails": ("email", "email_key", email_key),
+    "addresses": ("address", None, None),
+}
+
+
+class ContactRepository:
+    def __init__(self, db_name="contacts.db", cache_size=CACHE_SIZE, cache_ttl=None, instrumentation=None, shard=None):
+        self.instrumentation = instrumentation  # Optional Instrumentation recording every operation, see instrumentation.py
+        self.shard = shard or (0, 1)  # (index, count): new contact IDs satisfy (id - 1) % count == index, see sharding.py
+        on_connect = instrumentation.attach if instrumentation is not None else None
+        self.pool = ConnectionPool(db_name, on_connect=on_connect)  # Writes go through self.conn under pool.write_lock, reads through pool.reader()
+        self.conn = self.pool.writer
+        self.cursor = self.conn.cursor()
+        self.cache = LRUCache(cache_size, cache_ttl)  # FrozenContact per contact ID, see get_contact
+        self.data_version = None  # Commits of other connections the cache has seen, see cached_contact
+        self.create_tables()
+
+    def close(self):
+        """
+        Closes every connection to the database.
+        """
+        self.pool.close()
+
+    def create_tables(self):
+        """
+        Create database tables if they don't already exist, and upgrade the
+        schema of an existing database to the latest version.
+        """
+        migrate(self.conn)
+
+    def _next_contact_id(self, after):
+        """
+        Returns the smallest contact ID greater than `after` that belongs to this shard.
+        """
+        index, count = self.shard
+        return after + 1 + (index - after) % count
+
+    def _last_contact_id(self):
+        """
+        Returns the last contact ID this node has used, even if since deleted,
+        or the ID before its range if none (see migrations.allocate_contact_ids).
+        """
+        self.cursor.execute("SELECT last_contact_id FROM sync_node")
+        return self.cursor.fetchone()[0]
+
+    def _use_contact_ids(self, last):
+        """
+        Records in the current transaction that this node has used its contact IDs up to `last`.
+        """
+        self.cursor.execute("UPDATE sync_node SET last_contact_id = ?", (last,))
+
+    @instrumented("lookup", rows=lambda contact_id: int(contact_id is not None))
+    def find_contact_id(self, name):
+        """
+        Returns the ID of the oldest contact with exactly this name, or None.
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT MIN(id) FROM contacts WHERE name = ?", (name,))
+        return cursor.fetchone()[0]
+
+    @instrumented("lookup", rows=len)
+    def find_by_phone(self, phone):
+        """
+        Returns the IDs of the contacts having this phone number, however it is
+        written, through an index seek on its canonical key.
+        """
+        key = phone_key(phone)
+        if key is None:
+            return []
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT DISTINCT contact_id FROM phones WHERE phone_key = ? ORDER BY contact_id", (key,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @instrumented("lookup", rows=len)
+    def find_by_email(self, email):
+        """
+        Returns the IDs of the contacts having this email address, ignoring
+        case, through an index seek on its lowercased key.
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT DISTINCT contact_id FROM emails WHERE email_key = ? ORDER BY contact_id", (email_key(email),))
+        return [row[0] for row in cursor.fetchall()]
+
+    def backfill_keys(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        """
+        Computes the lookup keys of the phones and emails written before they
+        had one, `batch_size` rows per transaction so other writers are not
+        held up, calling progress(table, rows done) after each batch. A value
+        whose key the contact already has under another spelling is deleted.
+        Returns the number of rows filled in or deleted.
+        """
+        total = 0
+        for table, (column, key, key_of) in VALUE_TABLES.items():
+            if not key:
+                continue
+            after, done = 0, 0
+            while True:
+                with self.pool.write_lock:
+                    self.cursor.execute(f"SELECT id, {column} FROM {table} WHERE id > ? AND {key} IS NULL ORDER BY id LIMIT ?",
+                                        (after, batch_size))
+                    rows = self.cursor.fetchall()
+                    if not rows:
+                        break
+                    keys = [(key_of(value), row_id) for row_id, value in rows]
+                    self.cursor.executemany(f"UPDATE OR IGNORE {table} SET {key} = ? WHERE id = ?", keys)
+                    self.cursor.executemany(f"DELETE FROM {table} WHERE id = ? AND {key} IS NULL",
+                                            [(row_id,) for value, row_id in keys if value is not None])
+                    self.conn.commit()
+                after, done = rows[-1][0], done + len(rows)
+                if progress:
+                    progress(table, done)
+            total += done
+        return total
+
+    @instrumented("add", rows=lambda contact_id: 1)
+    def create_contact(self, name, phones=None, emails=None, addresses=None, notes=""):
+        """
+        Adds a new contact, even if one with the same name exists, and returns its ID.
+        """
+        with self.pool.write_lock:
+            try:
+                contact_id = self._next_contact_id(self._last_contact_id())
+                self.cursor.execute("INSERT INTO contacts (id, name, notes) VALUES (?, ?, ?)", (contact_id, name, notes))
+                self._use_contact_ids(contact_id)
+
+                self._insert_values("phones", [(contact_id, phone) for phone in phones or []])
+                self._insert_values("emails", [(contact_id, email) for email in emails or []])
+                self._insert_values("addresses", [(contact_id, address) for address in addresses or []])
+
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.cache.invalidate(contact_id)
+        return contact_id
+
+    @instrumented("merge")
+    def merge_contact(self, contact_id, phones, emails, addresses, notes):
+        """
+        Merges additional details into an existing contact; returns True if it
+        exists. Nothing is written for a missing contact.
+        """
+        with self.pool.write_lock:
+            try:
+                self.cursor.execute("SELECT notes FROM contacts WHERE id = ?", (contact_id,))
+                row = self.cursor.fetchone()
+                if row is None:
+                    return False
+                self._insert_values("phones", [(contact_id, phone) for phone in phones])
+                self._insert_values("emails", [(contact_id, email) for email in emails])
+                self._insert_values("addresses", [(contact_id, address) for address in addresses])
+
+                # Append notes
+                if notes:
+                    updated_notes = f"{row[0]}\n{notes}" if row[0] else notes
+                    self.cursor.execute("UPDATE contacts SET notes = ? WHERE id = ?", (updated_notes, contact_id))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.cache.invalidate(contact_id)
+        return True
+
+    @staticmethod
+    def _value_rows(table, rows):
+        """
+        Normalizes (contact_id, value) rows for `table` before they are written:
+        values are stripped, empty ones dropped, and the lookup key of the
+        table, if any, is appended to each row.
+        """
+        key_of = VALUE_TABLES[table][2]
+        normalized = []
+        for contact_id, value in rows:
+            value = (value or "").strip()
+            if value:
+                normalized.append((contact_id, value, key_of(value)) if key_of else (contact_id, value))
+        return normalized
+
+    @staticmethod
+    def _add_value_sql(table):
+        column, key, key_of = VALUE_TABLES[table]
+        if key:
+            return f"INSERT OR IGNORE INTO {table} (contact_id, {column}, {key}) VALUES (?1, ?2, ?3)"
+        return f"INSERT OR IGNORE INTO {table} (contact_id, {column}) VALUES (?1, ?2)"
+
+    @staticmethod
+    def _remove_value_sql(table):
+        column, key, key_of = VALUE_TABLES[table]
+        if key:  # Matches the value however it is written
+            return f"DELETE FROM {table} WHERE contact_id = ?1 AND ({column} = ?2 OR {key} = ?3)"
+        return f"DELETE FROM {table} WHERE contact_id = ?1 AND {column} = ?2"
+
+    def _insert_values(self, table, rows):
+        """
+        Adds normalized (contact_id, value) rows to `table` in the current
+        transaction, ignoring values a contact already has.
+        """
+        self.cursor.executemany(self._add_value_sql(table), self._value_rows(table, rows))
+
+    @instrumented("edit")
+    def _write_many(self, sql, rows):
+        """
+        Runs `sql` once per row of parameters in a single transaction, under the
+        write lock, and drops every contact touched from the cache. The first
+        parameter of each row is the contact ID. Returns the number of rows changed.
+        """
+        rows = list(rows)
+        with self.pool.write_lock:
+            try:
+                self.cursor.executemany(sql, rows)
+                changed = self.cursor.rowcount
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            for row in rows:
+                self.cache.invalidate(row[0])
+        return changed
+
+    def update_name(self, contact_id, name):
+        """
+        Renames a contact; returns True if it exists.
+        """
+        return self.update_name_many([(contact_id, name)]) > 0
+
+    def update_name_many(self, rows):
+        """
+        Renames every contact of the (contact_id, name) rows in one transaction.
+        Returns the number of contacts renamed.
+        """
+        return self._write_many("UPDATE contacts SET name = ?2 WHERE id = ?1", rows)
+
+    def set_notes(self, contact_id, notes):
+        """
+        Replaces the notes of a contact; returns True if it exists.
+        """
+        return self.set_notes_many([(contact_id, notes)]) > 0
+
+    def set_notes_many(self, rows):
+        """
+        Replaces the notes of every contact of the (contact_id, notes) rows in
+        one transaction. Returns the number of contacts updated.
+        """
+        return self._write_many("UPDATE contacts SET notes = ?2 WHERE id = ?1", rows)
+
+    def add_phone(self, contact_id, phone):
+        """
+        Adds a phone to a contact; returns False if the contact already has it.
+        """
+        return self.add_phone_many([(contact_id, phone)]) > 0
+
+    def add_phone_many(self, rows):
+        """
+        Adds the (contact_id, phone) rows in one transaction; returns the number of phones added.
+        """
+        return self._write_many(self._add_value_sql("phones"), self._value_rows("phones", rows))
+
+    def remove_phone(self, contact_id, phone):
+        """
+        Removes a phone from a contact; returns True if the contact had it.
+        """
+        return self.remove_phone_many([(contact_id, phone)]) > 0
+
+    def remove_phone_many(self, rows):
+        """
+        Removes the (contact_id, phone) rows in one transaction; returns the number of phones removed.
+        """
+        return self._write_many(self._remove_value_sql("phones"), self._value_rows("phones", rows))
+
+    def add_email(self, contact_id, email):
+        """
+        Adds an email to a contact; returns False if the contact already has it.
+        """
+        return self.add_email_many([(contact_id, email)]) > 0
+
+    def add_email_many(self, rows):
+        """
+        Adds the (contact_id, email) rows in one transaction; returns the number of emails added.
+        """
+        return self._write_many(self._add_value_sql("emails"), self._value_rows("emails", rows))
+
+    def remove_email(self, contact_id, email):
+        """
+        Removes an email from a contact; returns True if the contact had it.
+        """
+        return self.remove_email_many([(contact_id, email)]) > 0
+
+    def remove_email_many(self, rows):
+        """
+        Removes the (contact_id, email) rows in one transaction; returns the number of emails removed.
+        """
+        return self._write_many(self._remove_value_sql("emails"), self._value_rows("emails", rows))
+
+    def add_address(self, contact_id, address):
+        """
+        Adds an address to a contact; returns False if the contact already has it.
+        """
+        return self.add_address_many([(contact_id, address)]) > 0
+
+    def add_address_many(self, rows):
+        """
+        Adds the (contact_id, address) rows in one transaction; returns the number of addresses added.
+        """
+        return self._write_many(self._add_value_sql("addresses"), self._value_rows("addresses", rows))
+
+    def remove_address(self, contact_id, address):
+        """
+        Removes an address from a contact; returns True if the contact had it.
+        """
+        return self.remove_address_many([(contact_id, address)]) > 0
+
+    def remove_address_many(self, rows):
+        """
+        Removes the (contact_id, address) rows in one transaction; returns the number of addresses removed.
+        """
+        return self._write_many(self._remove_value_sql("addresses"), self._value_rows("addresses", rows))
+
+    def merge_duplicate(self, contact_id, duplicate_id):
+        """
+        Merges a duplicate contact into `contact_id` like merge_contact, then
+        deletes the duplicate. Returns True if both contacts existed and differ.
+        """
+        return self.merge_duplicate_many([(contact_id, duplicate_id)]) > 0
+
+    @instrumented("merge")
+    def merge_duplicate_many(self, rows):
+        """
+        Merges every duplicate of the (contact_id, duplicate_id) rows into its
+        contact and deletes it, in one transaction. Rows whose contact does not
+        exist, or is the duplicate itself, are skipped. Returns the number of
+        duplicates merged.
+        """
+        rows = list(rows)
+        with self.pool.write_lock:
+            try:
+                # As in bulk_import, the rows are staged in a temporary table and each
+                # table is changed by one statement, so the search index is flushed once.
+                self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS merge_rows (seq INTEGER PRIMARY KEY, contact_id INTEGER, duplicate_id INTEGER)")
+                self.cursor.executemany("INSERT INTO merge_rows (contact_id, duplicate_id) VALUES (?, ?)", rows)
+                # Never delete a duplicate without a contact to keep its values
+                self.cursor.execute("""
+                    DELETE FROM merge_rows
+                    WHERE contact_id = duplicate_id OR NOT EXISTS (SELECT 1 FROM contacts WHERE id = merge_rows.contact_id)
+                """)
+                self.cursor.execute("""
+                    SELECT merge_rows.contact_id, contacts.notes, duplicate.notes FROM merge_rows
+                    JOIN contacts ON contacts.id = merge_rows.contact_id
+                    JOIN contacts AS duplicate ON duplicate.id = merge_rows.duplicate_id
+                    ORDER BY merge_rows.seq
+                """)
+                notes = {}
+                for contact_id, existing_notes, duplicate_notes in self.cursor.fetchall():
+                    if duplicate_notes:  # Only notes that change are written
+                        existing_notes = notes.get(contact_id, existing_notes)
+                        notes[contact_id] = f"{existing_notes}\n{duplicate_notes}" if existing_notes else duplicate_notes
+                for table, (column, key, key_of) in VALUE_TABLES.items():
+                    columns = [column, key] if key else [column]
+                    self.cursor.execute(f"""
+                        INSERT OR IGNORE INTO {table} (contact_id, {', '.join(columns)})
+                        SELECT merge_rows.contact_id, {', '.join(f'{table}.{name}' for name in columns)} FROM merge_rows
+                        JOIN {table} ON {table}.contact_id = merge_rows.duplicate_id
+                        ORDER BY merge_rows.seq, {table}.id
+                    """)
+                    self.cursor.execute(f"DELETE FROM {table} WHERE contact_id IN (SELECT duplicate_id FROM merge_rows)")
+                self.cursor.execute("DELETE FROM contacts WHERE id IN (SELECT duplicate_id FROM merge_rows)")
+                merged = self.cursor.rowcount
+                self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS merge_notes (contact_id INTEGER PRIMARY KEY, notes TEXT)")
+                self.cursor.executemany("INSERT OR REPLACE INTO merge_notes VALUES (?, ?)", notes.items())
+                self.cursor.execute("""
+                    UPDATE contacts SET notes = (SELECT notes FROM merge_notes WHERE merge_notes.contact_id = contacts.id)
+                    WHERE id IN (SELECT contact_id FROM merge_notes)
+                """)
+                self.cursor.execute("DELETE FROM merge_rows")
+                self.cursor.execute("DELETE FROM merge_notes")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            for contact_id, duplicate_id in rows:
+                self.cache.invalidate(contact_id)
+                self.cache.invalidate(duplicate_id)
+        return merged
+
+    def delete_contact(self, contact_id):
+        """
+        Deletes a contact with all of its phones, emails and addresses.
+        Returns True if the contact existed.
+        """
+        return self.delete_contact_many([contact_id]) > 0
+
+    @instrumented("delete")
+    def delete_contact_many(self, contact_ids):
+        """
+        Deletes the given contacts with all of their values in one transaction.
+        Returns the number of contacts deleted.
+        """
+        rows = [(contact_id,) for contact_id in contact_ids]
+        with self.pool.write_lock:
+            try:
+                for table in ("phones", "emails", "addresses"):
+                    self.cursor.executemany(f"DELETE FROM {table} WHERE contact_id = ?", rows)
+                self.cursor.executemany("DELETE FROM contacts WHERE id = ?", rows)
+                deleted = self.cursor.rowcount
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            for (contact_id,) in rows:
+                self.cache.invalidate(contact_id)
+        return deleted
+
+    @instrumented("import", rows=lambda counts: counts["added"] + counts["merged"])
+    def bulk_import(self, records, on_duplicate="skip", batch_size=IMPORT_BATCH_SIZE, progress=None):
+        """
+        Imports contact records without any prompt, in batches of `batch_size`
+        written with executemany inside a single transaction. Each record is a
+        dict with "name", "notes" and lists of "phones", "emails" and "addresses".
+        `records` may be any iterable, so a generator is imported in constant memory.
+        A record whose name already exists is skipped, merged into the existing
+        contact or created as a new contact, according to `on_duplicate`.
+        After each batch, `progress` (if given) is called with the number of
+        records processed so far and the records per second.
+        Returns the number of contacts added, merged and skipped.
+        """
+        if on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError(f"on_duplicate must be one of {', '.join(DUPLICATE_POLICIES)}, not '{on_duplicate}'")
+
+        counts = {"added": 0, "merged": 0, "skipped": 0}
+        merged = set()  # Existing contacts changed, dropped from the cache once committed
+        records = iter(records)
+        start = time.perf_counter()
+        with self.pool.write_lock:
+            try:
+                # IDs are assigned here so that contacts and their values can be inserted with executemany
+                next_id = self._next_contact_id(self._last_contact_id())
+                while True:
+                    batch = list(islice(records, batch_size))
+                    if not batch:
+                        break
+                    next_id = self._import_batch(batch, on_duplicate, next_id, counts, merged)
+                    if progress:
+                        done = sum(counts.values())
+                        progress(done, done / (time.perf_counter() - start))
+                if counts["added"]:
+                    self._use_contact_ids(next_id - 1)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            for contact_id in merged:
+                self.cache.invalidate(contact_id)
+        return counts
+
+    def _import_batch(self, batch, on_duplicate, next_id, counts, merged):
+        """
+        Writes one batch of bulk_import and returns the next free contact ID.
+        The IDs of the existing contacts merged into are added to `merged`.
+        """
+        existing = {}
+        if on_duplicate != "create":
+            names = list({(record.get("name") or "").strip() for record in batch})
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                self.cursor.execute(f"SELECT name, MIN(id) FROM contacts WHERE name IN ({', '.join('?' * len(chunk))}) GROUP BY name", chunk)
+                existing.update(self.cursor.fetchall())
+
+        contacts, notes_updates = [], []
+        values = {"phones": [], "emails": [], "addresses": []}
+        for record in batch:
+            name = (record.get("name") or "").strip()
+            notes = (record.get("notes") or "").strip()
+            contact_id = existing.get(name)
+            if contact_id is None:
+                contact_id = next_id
+                next_id = self._next_contact_id(next_id)
+                contacts.append((contact_id, name, notes))
+                if on_duplicate != "create":
+                    existing[name] = contact_id  # Later records of this batch are duplicates of this one
+                counts["added"] += 1
+            elif on_duplicate == "skip":
+                counts["skipped"] += 1
+                continue
+            else:
+                if notes:
+                    notes_updates.append((notes, notes, contact_id))
+                merged.add(contact_id)
+                counts["merged"] += 1
+            for key in values:
+                values[key].extend(self._value_rows(key, [(contact_id, value) for value in clean_values(record.get(key))]))
+
+        # Rows are staged in temporary tables and copied with one INSERT ... SELECT per
+        # table: the search index triggers then flush FTS5 once per statement instead
+        # of once per row. Values go in before their new contacts, so that each contact
+        # is added to the search index once, with all of its emails and addresses.
+        self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS import_contacts (id INTEGER, name TEXT, notes TEXT)")
+        self.cursor.executemany("INSERT INTO import_contacts VALUES (?, ?, ?)", contacts)
+        for table, (column, key, key_of) in VALUE_TABLES.items():
+            self.cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_{table} (contact_id INTEGER, value TEXT, key TEXT)")
+            rows = values[table] if key else [(contact_id, value, None) for contact_id, value in values[table]]
+            self.cursor.executemany(f"INSERT INTO import_{table} VALUES (?, ?, ?)", rows)
+            target, source = (f"{column}, {key}", "value, key") if key else (column, "value")
+            self.cursor.execute(f"INSERT OR IGNORE INTO {table} (contact_id, {target}) SELECT contact_id, {source} FROM import_{table}")
+            self.cursor.execute(f"DELETE FROM import_{table}")
+        self.cursor.execute("INSERT INTO contacts (id, name, notes) SELECT id, name, notes FROM import_contacts")
+        self.cursor.execute("DELETE FROM import_contacts")
+        self.cursor.executemany("""
+            UPDATE contacts SET notes = CASE WHEN notes IS NULL OR notes = '' THEN ? ELSE notes || char(10) || ? END
+            WHERE id = ?
+        """, notes_updates)
+        return next_id
+
+    @instrumented("list", rows=lambda result: len(result[0]))
+    def list_contacts(self, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of contacts as (id, name, phones) tuples, ordered by ID,
+        together with the cursor of the next page (None on the last page).
+        Phones are aggregated in the same query, so a page costs a single round trip.
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute("""
+            SELECT c.id, c.name, GROUP_CONCAT(p.phone, ', ')
+            FROM (SELECT id, name FROM contacts WHERE id > ? ORDER BY id LIMIT ?) AS c
+            LEFT JOIN phones p ON p.contact_id = c.id
+            GROUP BY c.id
+            ORDER BY c.id
+        """, (after if after is not None else 0, limit + 1))
+        rows = cursor.fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1][0]
+        return rows, None
+
+    @instrumented("list", rows=lambda result: len(result[0]))
+    def list_contacts_by_name(self, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of contacts as (id, name, phones) tuples ordered by
+        name, ignoring case, then ID, and the (name, id) cursor of the next
+        page (None on the last page). `after` is such a cursor; (prefix, 0)
+        starts the page at the first name not sorting before `prefix`, in any
+        case. Pages seek idx_contacts_name_nocase.
+        """
+        name, contact_id = after if after is not None else ("", 0)
+        cursor = self.pool.reader().cursor()
+        # The collation on the parameter makes the whole row-value comparison NOCASE, which SQLite can seek
+        cursor.execute("""
+            SELECT c.id, c.name, (SELECT GROUP_CONCAT(phone, ', ') FROM phones WHERE contact_id = c.id)
+            FROM contacts c
+            WHERE (c.name, c.id) > (? COLLATE NOCASE, ?)
+            ORDER BY c.name COLLATE NOCASE, c.id
+            LIMIT ?
+        """, (name, contact_id, limit + 1))
+        rows = cursor.fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, (rows[-1][1], rows[-1][0])
+        return rows, None
+
+    def change_counter(self):
+        """
+        Returns a value that changes whenever any connection, in this process or
+        another, commits a change to the database. Compare two values to tell
+        whether data read in between may be stale.
+        """
+        data_version = self.pool.reader().execute("PRAGMA data_version").fetchone()[0]  # Commits of other connections
+        return self.conn.total_changes, data_version  # The writer's own changes, needed when it is also the reader
+
+    def cached_contact(self, contact_id):
+        """
+        Returns the cached FrozenContact of the given ID, or None. The cache is
+        dropped first if another connection, e.g. an importer or sync process,
+        committed since it was last checked: its writes never invalidate it.
+        """
+        # The writer's data_version only moves on commits of other connections; ours invalidate the cache themselves
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.cache.clear()
+            self.data_version = data_version
+        return self.cache.get(contact_id)
+
+    @instrumented("inspect", rows=lambda contact: int(contact is not None))
+    def get_contact(self, contact_id):
+        """
+        Returns the contact with the given ID as a FrozenContact, or None if
+        there is none. Contacts are served from an LRU cache that every write
+        path of the manager invalidates, and that is dropped whenever another
+        connection commits.
+        """
+        contact = self.cached_contact(contact_id)
+        if contact is not None:
+            return contact
+        generation = self.cache.generation  # A write committed while reading must not be cached over
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT name, notes FROM contacts WHERE id = ?", (contact_id,))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        name, notes = result
+        values = {}
+        for table, column in (("phones", "phone"), ("emails", "email"), ("addresses", "address")):
+            cursor.execute(f"SELECT {column} FROM {table} WHERE contact_id = ? ORDER BY id", (contact_id,))
+            values[table] = [row[0] for row in cursor.fetchall()]
+        contact = FrozenContact(contact_id, name, values["phones"], values["emails"], values["addresses"], notes or "")
+        self.cache.put(contact_id, contact, generation)
+        return contact
+
+    @instrumented("load", rows=len)
+    def load_batch(self, after=None, limit=EXPORT_BATCH_SIZE):
+        """
+        Returns, as a ContactBatch, up to `limit` contacts with an ID greater
+        than `after`, ordered by ID. The values of the batch are fetched with
+        one range query per table.
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT id, name, notes FROM contacts WHERE id > ? ORDER BY id LIMIT ?", (after or 0, limit))
+        contacts = cursor.fetchall()
+        if not contacts:
+            return ContactBatch()
+        values = []
+        for table, column in (("phones", "phone"), ("emails", "email"), ("addresses", "address")):
+            cursor.execute(f"SELECT contact_id, {column} FROM {table} WHERE contact_id BETWEEN ? AND ? ORDER BY contact_id, id",
+                           (contacts[0][0], contacts[-1][0]))
+            values.append(cursor.fetchall())
+        return ContactBatch.from_rows(contacts, *values)
+
+    def iter_batches(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every contact, ordered by ID, in ContactBatch columns of up to
+        `batch_size` contacts. Memory use only depends on `batch_size`, not on
+        the size of the database.
+        """
+        after = None
+        while True:
+            batch = self.load_batch(after, batch_size)
+            if not batch:
+                return
+            yield batch
+            after = batch.ids[-1]
+
+    def iter_contacts(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every contact as a Contact, ordered by ID, reading `batch_size` at a time.
+        """
+        for batch in self.iter_batches(batch_size):
+            yield from batch
+
+    def iter_lookup_keys(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every contact, ordered by ID, as (id, name, phone keys, email keys)
+        tuples in lists of up to `batch_size`. Keys are read as stored; only
+        values not backfilled yet have theirs computed here.
+        """
+        cursor = self.pool.reader().cursor()
+        after = 0
+        while True:
+            cursor.execute("SELECT id, name FROM contacts WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size))
+            contacts = cursor.fetchall()
+            if not contacts:
+                return
+            keys = {}  # (table, contact_id) -> keys
+            for table in ("phones", "emails"):
+                column, key, key_of = VALUE_TABLES[table]
+                cursor.execute(f"SELECT contact_id, {key}, {column} FROM {table} WHERE contact_id BETWEEN ? AND ?",
+                               (contacts[0][0], contacts[-1][0]))
+                for contact_id, value_key, value in cursor.fetchall():
+                    value_key = value_key or key_of(value)
+                    if value_key:
+                        keys.setdefault((table, contact_id), []).append(value_key)
+            yield [(contact_id, name, keys.get(("phones", contact_id), []), keys.get(("emails", contact_id), []))
+                   for contact_id, name in contacts]
+            after = contacts[-1][0]
+
+    @instrumented("search", rows=len)
+    def search_contact(self, keyword, category="all", limit=SEARCH_LIMIT):
+        """
+        Searches contacts by keyword in the given category ("name", "phone", "email",
+        "address" or "all") and returns ranked (id, name, phones) tuples.
+        Raises ValueError for any other category.
+        Words match by prefix through the full-text index, phone numbers match any
+        run of at least 3 of their digits (prefix, suffix or middle) through the
+        trigram index.
+        """
+        if category not in SEARCH_CATEGORIES:
+            raise ValueError(f"Invalid category '{category}'. Choose from: {', '.join(SEARCH_CATEGORIES)}.")
+
+        contact_ids = []
+        if category in SEARCH_COLUMNS:
+            contact_ids += self._search_text(keyword, SEARCH_COLUMNS[category], limit)
+        if category in ("phone", "all"):
+            contact_ids += [contact_id for contact_id in self._search_phone(keyword, limit) if contact_id not in contact_ids]
+        contact_ids = contact_ids[:limit]
+        if not contact_ids:
+            return []
+
+        placeholders = ", ".join("?" * len(contact_ids))
+        cursor = self.pool.reader().cursor()
+        cursor.execute(f"""
+            SELECT c.id, c.name, GROUP_CONCAT(p.phone, ', ')
+            FROM contacts c
+            LEFT JOIN phones p ON p.contact_id = c.id
+            WHERE c.id IN ({placeholders})
+            GROUP BY c.id
+        """, contact_ids)
+        rows = {row[0]: row for row in cursor.fetchall()}
+        return [rows[contact_id] for contact_id in contact_ids if contact_id in rows]
+
+    def _search_text(self, keyword, column, limit):
+        """
+        Returns the IDs of the contacts whose indexed text (optionally restricted
+        to one column) contains every word of the keyword as a prefix. bm25
+        scores every contact matching each word, so results are ranked best
+        first only if no word matches more than SEARCH_RANK_LIMIT contacts;
+        otherwise the first matches by ID are returned.
+        """
+        words = ['"' + word.replace('"', '""') + '"*' for word in keyword.split()]
+        if not words:
+            return []
+        cursor = self.pool.reader().cursor()
+        scope = f"{column} : " if column else ""
+        for word in words:
+            cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM contacts_fts WHERE contacts_fts MATCH ? LIMIT ?)",
+                           (f"{scope}({word})", SEARCH_RANK_LIMIT + 1))
+            if cursor.fetchone()[0] > SEARCH_RANK_LIMIT:
+                order = "rowid"  # Too common to rank without scoring all its matches
+                break
+        else:
+            order = "rank"
+        cursor.execute(f"SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ? ORDER BY {order} LIMIT ?",
+                       (f"{scope}({' '.join(words)})", limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _search_phone(self, keyword, limit):
+        """
+        Returns the IDs of the contacts having a phone number that contains the
+        digits of the keyword, which needs MIN_PHONE_DIGITS of them. Exact
+        matches come first through the lookup key index, then the first
+        SEARCH_RANK_LIMIT trigram matches, prefix matches and shorter numbers first.
+        """
+        digits = "".join(char for char in keyword if char.isdigit())
+        if len(digits) < MIN_PHONE_DIGITS:
+            return []
+        cursor = self.pool.reader().cursor()
+        cursor.execute("SELECT contact_id FROM phones WHERE phone_key = ? LIMIT ?", (phone_key(keyword), limit))
+        contact_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT digits, contact_id FROM phones_fts WHERE phones_fts MATCH ? LIMIT ?", (f'"{digits}"', SEARCH_RANK_LIMIT))
+        # Sorted here: an ORDER BY around the LIMIT makes SQLite read every match
+        for number, contact_id in sorted(cursor.fetchall(), key=lambda row: (not row[0].startswith(digits), len(row[0]))):
+            if len(contact_ids) == limit:
+                break
+            if contact_id not in contact_ids:
+                contact_ids.append(contact_id)
+        return contact_ids
@@ -0,0 +1,422 @@
+"""
+Contact storage partitioned across several SQLite files.
+
+Every shard is a ContactRepository with its own file, writer connection and
+write lock, so writes to different shards run in parallel. A contact lives
+on shard (id - 1) % N: each shard only assigns IDs of its own residue, so a
+contact is found from its ID alone. A new contact is placed on the shard
+given by a hash of its name, which keeps duplicate names on one shard for
+bulk_import. Listing and search query every shard in parallel on a thread
+pool and merge the results in order. Writes to one contact go to one shard
+and keep the transactions of ContactRepository; batched writes run one
+transaction per shard involved.
+
+An existing database is split into shards with e.g.:
+
+    python sharding.py contacts.db --shards shard0.db shard1.db shard2.db shard3.db
+"""
+import argparse
+import heapq
+import string
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from contact import ContactBatch
+from contact_manager import ContactManager
+from repository import ContactRepository, CACHE_SIZE, EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE, PAGE_SIZE, SEARCH_LIMIT, VALUE_TABLES
+
+NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)  # Folds names like SQLite's NOCASE collation
+
+
+def _routed(name):
+    """
+    Returns a method calling the shard method `name` on the shard of the
+    contact ID passed as first argument.
+    """
+    def method(self, contact_id, *args):
+        return getattr(self.shard_of(contact_id), name)(contact_id, *args)
+    method.__name__ = name
+    method.__doc__ = f"Runs ContactRepository.{name} on the shard of the contact."
+    return method
+
+
+def _routed_many(name):
+    """
+    Returns a method splitting rows whose first item is a contact ID by shard
+    and calling the shard method `name` on each group, one transaction per
+    shard. The method returns the sum of the results.
+    """
+    def method(self, rows):
+        return sum(getattr(self.shards[index], name)(group) for index, group in self._group_by_shard(rows, lambda row: row[0]))
+    method.__name__ = name
+    method.__doc__ = f"Runs ContactRepository.{name} on every shard with its rows; returns the total."
+    return method
+
+
+class ShardedCache:
+    """
+    The contact caches of every shard, seen as one cache keyed by contact ID.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def get(self, contact_id, default=None):
+        return self.repository.shard_of(contact_id).cache.get(contact_id, default)
+
+    def invalidate(self, contact_id):
+        self.repository.shard_of(contact_id).cache.invalidate(contact_id)
+
+    def clear(self):
+        for shard in self.repository.shards:
+            shard.cache.clear()
+
+    def stats(self):
+        """
+        Returns the counters of every shard cache, summed.
+        """
+        totals = {}
+        for shard in self.repository.shards:
+            for key, value in shard.cache.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def __len__(self):
+        return sum(len(shard.cache) for shard in self.repository.shards)
+
+
+class ShardedContactRepository(ContactRepository):
+    """
+    The ContactRepository API over a list of shard files. Shards must always
+    be opened in the same order; use reshard() to change their number.
+    There is no single connection: every method of ContactRepository is
+    overridden to run on the shards, and `cache` covers every shard cache.
+    """
+
+    def __init__(self, shard_paths, cache_size=CACHE_SIZE, cache_ttl=None, instrumentation=None, max_workers=None):
+        count = len(shard_paths)
+        if not count:
+            raise ValueError("At least one shard file is needed.")
+        self.instrumentation = instrumentation
+        self.shards = [ContactRepository(path, cache_size, cache_ttl, instrumentation, shard=(index, count))
+                       for index, path in enumerate(shard_paths)]
+        self.executor = ThreadPoolExecutor(max_workers or count, thread_name_prefix="shards")
+        self.cache = ShardedCache(self)
+
+    def close(self):
+        """
+        Stops the thread pool and closes every connection of every shard.
+        """
+        self.executor.shutdown()
+        for shard in self.shards:
+            shard.close()
+
+    def create_tables(self):
+        """
+        Creates or upgrades the schema of every shard.
+        """
+        for shard in self.shards:
+            shard.create_tables()
+
+    def shard_of(self, contact_id):
+        """
+        Returns the shard holding the contact with the given ID.
+        """
+        return self.shards[(contact_id - 1) % len(self.shards)]
+
+    def _placement(self, name):
+        """
+        Returns the index of the shard a new contact with this name goes to.
+        """
+        return zlib.crc32((name or "").strip().encode("utf-8")) % len(self.shards)
+
+    def _group_by_shard(self, items, contact_id_of):
+        """
+        Returns (shard index, list of items) for every shard having some of the items.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault((contact_id_of(item) - 1) % len(self.shards), []).append(item)
+        return sorted(groups.items())
+
+    def _map(self, name, *args):
+        """
+        Calls the method `name` on every shard in parallel and returns the results in shard order.
+        """
+        return list(self.executor.map(lambda shard: getattr(shard, name)(*args), self.shards))
+
+    def find_contact_id(self, name):
+        """
+        Returns the ID of the oldest contact with exactly this name on any shard, or None.
+        """
+        ids = [contact_id for contact_id in self._map("find_contact_id", name) if contact_id is not None]
+        return min(ids) if ids else None
+
+    def find_by_phone(self, phone):
+        """
+        Returns the IDs of the contacts having this phone number on any shard.
+        """
+        return sorted(contact_id for ids in self._map("find_by_phone", phone) for contact_id in ids)
+
+    def find_by_email(self, email):
+        """
+        Returns the IDs of the contacts having this email address on any shard.
+        """
+        return sorted(contact_id for ids in self._map("find_by_email", email) for contact_id in ids)
+
+    def backfill_keys(self, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        """
+        Fills in the missing lookup keys of every shard, in parallel.
+        """
+        return sum(self._map("backfill_keys", batch_size, progress))
+
+    def create_contact(self, name, phones=None, emails=None, addresses=None, notes=""):
+        """
+        Adds a new contact on the shard of its name and returns its ID.
+        """
+        return self.shards[self._placement(name)].create_contact(name, phones, emails, addresses, notes)
+
+    merge_contact = _routed("merge_contact")
+    cached_contact = _routed("cached_contact")
+    get_contact = _routed("get_contact")
+    update_name = _routed("update_name")
+    set_notes = _routed("set_notes")
+    add_phone = _routed("add_phone")
+    remove_phone = _routed("remove_phone")
+    add_email = _routed("add_email")
+    remove_email = _routed("remove_email")
+    add_address = _routed("add_address")
+    remove_address = _routed("remove_address")
+    delete_contact = _routed("delete_contact")
+
+    def _write_many(self, sql, rows):
+        """
+        Runs `sql` once per row of parameters, whose first item is a contact ID,
+        on the shard of each row, one transaction per shard; returns the total.
+        """
+        return sum(self.shards[index]._write_many(sql, group) for index, group in self._group_by_shard(rows, lambda row: row[0]))
+
+    update_name_many = _routed_many("update_name_many")
+    set_notes_many = _routed_many("set_notes_many")
+    add_phone_many = _routed_many("add_phone_many")
+    remove_phone_many = _routed_many("remove_phone_many")
+    add_email_many = _routed_many("add_email_many")
+    remove_email_many = _routed_many("remove_email_many")
+    add_address_many = _routed_many("add_address_many")
+    remove_address_many = _routed_many("remove_address_many")
+
+    def delete_contact_many(self, contact_ids):
+        """
+        Deletes the given contacts, one transaction per shard; returns the number deleted.
+        """
+        return sum(self.shards[index].delete_contact_many(group)
+                   for index, group in self._group_by_shard(contact_ids, lambda contact_id: contact_id))
+
+    def merge_duplicate(self, contact_id, duplicate_id):
+        """
+        Merges a duplicate contact into `contact_id` and deletes it, even across shards.
+        """
+        return self.merge_duplicate_many([(contact_id, duplicate_id)]) > 0
+
+    def merge_duplicate_many(self, rows):
+        """
+        Merges every duplicate of the (contact_id, duplicate_id) rows into its
+        contact. Pairs on one shard are merged by that shard in one transaction;
+        a duplicate on another shard is copied with merge_contact, then deleted.
+        """
+        local, remote = [], []
+        for row in rows:
+            (local if self.shard_of(row[0]) is self.shard_of(row[1]) else remote).append(row)
+        merged = sum(self.shards[index].merge_duplicate_many(group) for index, group in self._group_by_shard(local, lambda row: row[0]))
+        for contact_id, duplicate_id in remote:
+            duplicate = self.get_contact(duplicate_id)
+            if duplicate is not None and self.merge_contact(contact_id, duplicate.phones, duplicate.emails,
+                                                            duplicate.addresses, duplicate.notes):
+                merged += self.delete_contact(duplicate_id)
+        return merged
+
+    def bulk_import(self, records, on_duplicate="skip", batch_size=IMPORT_BATCH_SIZE, progress=None):
+        """
+        Imports contact records like ContactRepository.bulk_import. Records are
+        placed on the shard of their name, so duplicates are found within it,
+        and every shard imports its batches on the thread pool, one
+        transaction per batch.
+        """
+        counts = {"added": 0, "merged": 0, "skipped": 0}
+        pending = [None] * len(self.shards)  # Import running on every shard
+        buffers = [[] for _ in self.shards]
+        start = time.perf_counter()
+
+        def wait(index):
+            if pending[index] is not None:
+                for key, value in pending[index].result().items():
+                    counts[key] += value
+                pending[index] = None
+                if progress:
+                    done = sum(counts.values())
+                    progress(done, done / (time.perf_counter() - start))
+
+        def flush(index):
+            wait(index)  # At most one import per shard at a time, in order
+            batch, buffers[index] = buffers[index], []
+            pending[index] = self.executor.submit(self.shards[index].bulk_import, batch, on_duplicate, batch_size)
+
+        for record in records:
+            index = self._placement(record.get("name"))
+            buffers[index].append(record)
+            if len(buffers[index]) >= batch_size:
+                flush(index)
+        for index in range(len(self.shards)):
+            if buffers[index]:
+                flush(index)
+            wait(index)
+        return counts
+
+    def list_contacts(self, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of (id, name, phones) tuples ordered by ID across
+        every shard, and the cursor of the next page (None on the last page).
+        """
+        pages = self._map("list_contacts", after, limit)
+        return self._merge_pages(pages, limit, lambda row: row[0], lambda row: row[0])
+
+    def list_contacts_by_name(self, after=None, limit=PAGE_SIZE):
+        """
+        Returns one page of (id, name, phones) tuples ordered by name, ignoring
+        case, then ID across every shard, and the (name, id) cursor of the next page.
+        """
+        pages = self._map("list_contacts_by_name", after, limit)
+        return self._merge_pages(pages, limit, lambda row: (row[1].translate(NOCASE), row[0]), lambda row: (row[1], row[0]))
+
+    def _merge_pages(self, pages, limit, key, cursor_of):
+        """
+        Merges the sorted pages of every shard into one page of `limit` rows.
+        """
+        rows = list(islice(heapq.merge(*(rows for rows, next_cursor in pages), key=key), limit + 1))
+        more = len(rows) > limit or any(next_cursor is not None for rows, next_cursor in pages)
+        rows = rows[:limit]
+        return rows, cursor_of(rows[-1]) if more and rows else None
+
+    def search_contact(self, keyword, category="all", limit=SEARCH_LIMIT):
+        """
+        Searches every shard like ContactRepository.search_contact. Ranks are
+        not comparable across shards, so the results are interleaved: every
+        shard's best match, then every shard's second best, and so on.
+        """
+        results = self._map("search_contact", keyword, category, limit)
+        ranked = sorted((position, index, row) for index, rows in enumerate(results) for position, row in enumerate(rows))
+        return [row for position, index, row in ranked[:limit]]
+
+    def iter_contacts(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every contact of every shard as a Contact, ordered by ID.
+        """
+        return heapq.merge(*(shard.iter_contacts(batch_size) for shard in self.shards), key=lambda contact: contact.id)
+
+    def load_batch(self, after=None, limit=EXPORT_BATCH_SIZE):
+        """
+        Returns, as a ContactBatch, up to `limit` contacts of any shard with an
+        ID greater than `after`, ordered by ID.
+        """
+        batches = self._map("load_batch", after, limit)
+        return self._to_batch(islice(heapq.merge(*batches, key=lambda contact: contact.id), limit))
+
+    def iter_batches(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields every contact of every shard, ordered by ID, in ContactBatch
+        columns of up to `batch_size` contacts. Every shard is read
+        `batch_size` contacts at a time, so no shard is read twice.
+        """
+        contacts = self.iter_contacts(batch_size)
+        while True:
+            batch = self._to_batch(islice(contacts, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def iter_lookup_keys(self, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Yields the (id, name, phone keys, email keys) of every contact of every
+        shard, ordered by ID, in lists of up to `batch_size`.
+        """
+        rows = heapq.merge(*((row for rows in shard.iter_lookup_keys(batch_size) for row in rows) for shard in self.shards))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    @staticmethod
+    def _to_batch(contacts):
+        batch = ContactBatch()
+        for contact in contacts:
+            batch.append(contact)
+        return batch
+
+    def change_counter(self):
+        """
+        Returns a value that changes whenever any shard changes.
+        """
+        return tuple(shard.change_counter() for shard in self.shards)
+
+
+class ShardedContactManager(ContactManager, ShardedContactRepository):
+    """
+    The interactive ContactManager over shard files.
+    """
+
+
+def reshard(sources, targets):
+    """
+    Copies every contact of the `sources` databases (one file, or the shards
+    of an earlier layout) into the `targets` shards, each contact to shard
+    (id - 1) % len(targets), keeping its ID. The targets should be new.
+    Returns the number of contacts copied.
+    """
+    for source in sources:
+        ContactRepository(source).close()  # Upgrades the schema of an older file
+    repository = ShardedContactRepository(targets)
+    count, copied = len(targets), 0
+    try:
+        for source in sources:
+            for index, shard in enumerate(repository.shards):
+                with shard.pool.write_lock:
+                    shard.cursor.execute("ATTACH DATABASE ? AS source", (source,))
+                    try:
+                        # Values go in before their contacts, as in bulk_import, so every contact is indexed once
+                        for table, (column, key, key_of) in VALUE_TABLES.items():
+                            columns = f"{column}, {key}" if key else column
+                            shard.cursor.execute(f"""
+                                INSERT OR IGNORE INTO {table} (contact_id, {columns})
+                                SELECT contact_id, {columns} FROM source.{table} WHERE (contact_id - 1) % ? = ? ORDER BY id
+                            """, (count, index))
+                        shard.cursor.execute("""
+                            INSERT INTO contacts (id, name, notes)
+                            SELECT id, name, notes FROM source.contacts WHERE (id - 1) % ? = ? ORDER BY id
+                        """, (count, index))
+                        copied += shard.cursor.rowcount
+                        shard.conn.commit()
+                    except Exception:
+                        shard.conn.rollback()
+                        raise
+                    finally:
+                        shard.cursor.execute("DETACH DATABASE source")
+    finally:
+        repository.close()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split contact databases into shard files.")
+    parser.add_argument("sources", nargs="+", help="Database to split, or every shard of an earlier layout.")
+    parser.add_argument("--shards", nargs="+", required=True, help="New shard files, in order.")
+    args = parser.parse_args()
+
+    copied = reshard(args.sources, args.shards)
+    print(f"Copied {copied} contacts into {len(args.shards)} shards.")
+
+
+if __name__ == "__main__":
+    main()
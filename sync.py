@@ -0,0 +1,225 @@
+"""
+Incremental replication between contact databases.
+
+Triggers log every row inserted, updated or deleted in the change_log table
+(see migrations.create_change_log and migrations.log_child_values).
+export_changes ships the changes after a sequence number as a compact,
+JSON-serializable batch, and apply_changes replays a batch on another node.
+Applying is idempotent: contacts are upserted or deleted by ID, phones,
+emails and addresses are added or removed by (contact_id, value), identical
+rows are left alone, and every node remembers the last sequence it applied
+from each peer, so a batch applied twice changes nothing. Run with e.g.:
+
+    python sync.py primary.db replica.db
+
+Contact IDs are copied as they are. Every node allocates new contact IDs
+from its own random range (see migrations.allocate_contact_ids), and
+batches carry the node owning every range known to their source, so a
+contact whose range belongs to another node here is refused instead of
+overwriting a different contact. Phones, emails and addresses get their own
+IDs on every node. A database file copied from another node shares its node
+ID and ID range and must get new ones with new_node_id before syncing.
+"""
+import argparse
+
+from migrations import RANDOM_CONTACT_ID_RANGE_SQL
+from repository import ContactRepository
+
+SYNC_BATCH_SIZE = 1000  # Change log entries shipped per batch
+FETCH_CHUNK_SIZE = 500  # Rows read per query when building a batch
+CONTACT_COLUMNS = ("name", "notes")  # Replicated columns of contacts, besides id
+
+
+def node_id(repository):
+    """
+    Returns the random ID identifying this database among the nodes.
+    """
+    return repository.pool.reader().execute("SELECT node_id FROM sync_node").fetchone()[0]
+
+
+def new_node_id(repository):
+    """
+    Gives this database a new node ID and a new range of contact IDs, e.g.
+    after copying its file from another node. The old range stays owned by
+    the old node ID.
+    """
+    with repository.pool.write_lock:
+        try:
+            repository.cursor.execute(f"""
+                UPDATE sync_node SET node_id = lower(hex(randomblob(8))), first_contact_id = {RANDOM_CONTACT_ID_RANGE_SQL}
+            """)
+            repository.cursor.execute("UPDATE sync_node SET last_contact_id = first_contact_id")
+            repository.cursor.execute("INSERT INTO sync_ranges (first_contact_id, node_id) SELECT first_contact_id, node_id FROM sync_node")
+            repository.conn.commit()
+        except Exception:
+            repository.conn.rollback()
+            raise
+    return node_id(repository)
+
+
+def peer_seq(repository, peer):
+    """
+    Returns the last sequence applied here from the node `peer`, 0 if none.
+    """
+    row = repository.pool.reader().execute("SELECT last_seq FROM sync_peers WHERE node_id = ?", (peer,)).fetchone()
+    return row[0] if row else 0
+
+
+def export_changes(repository, after=0, limit=SYNC_BATCH_SIZE):
+    """
+    Returns the changes logged after sequence `after`, covering at most `limit`
+    log entries, as a dict {"node", "from", "to", "ranges", "changes"}.
+    "ranges" lists the [first_contact_id, node_id] pairs of sync_ranges. A
+    change is ["contacts", "U", id, name, notes] for a contact to upsert,
+    ["contacts", "D", id] for one to delete, and [table, "I" or "D",
+    contact_id, value] for a phone, email or address to add or remove. A row
+    changed several times is shipped once, with its current state, in the
+    order of its last change.
+    """
+    conn = repository.pool.reader()
+    conn.execute("BEGIN")  # Reads the log and the rows from one snapshot
+    try:
+        entries = conn.execute("""
+            SELECT seq, table_name, op, row_id, contact_id, value FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?
+        """, (after, limit)).fetchall()
+        latest = {}  # Row identity -> operation of its last change, ordered by last change
+        for seq, table, op, row_id, contact_id, value in entries:
+            if table == "contacts":
+                key = (table, row_id)
+            elif value is not None:
+                key = (table, contact_id, value)
+            else:
+                continue  # A value deleted before the log recorded values
+            latest.pop(key, None)
+            latest[key] = op
+        ids = [key[1] for key in latest if key[0] == "contacts"]
+        current = {}  # id -> values of the contacts that still exist
+        for start in range(0, len(ids), FETCH_CHUNK_SIZE):
+            chunk = ids[start:start + FETCH_CHUNK_SIZE]
+            for row_id, *values in conn.execute(
+                    f"SELECT id, {', '.join(CONTACT_COLUMNS)} FROM contacts WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                current[row_id] = values
+        ranges = [list(row) for row in conn.execute("SELECT first_contact_id, node_id FROM sync_ranges ORDER BY first_contact_id")]
+    finally:
+        conn.rollback()
+    changes = []
+    for key, op in latest.items():
+        if key[0] != "contacts":
+            changes.append([key[0], op, key[1], key[2]])
+        elif key[1] in current:
+            changes.append(["contacts", "U", key[1], *current[key[1]]])
+        else:
+            changes.append(["contacts", "D", key[1]])
+    return {"node": node_id(repository), "from": after, "to": entries[-1][0] if entries else after, "ranges": ranges,
+            "changes": changes}
+
+
+def _apply_change(repository, table, op, *args):
+    cursor = repository.cursor
+    if table != "contacts":
+        if op == "D":  # Removes the value however the target wrote it
+            cursor.executemany(repository._remove_value_sql(table), repository._value_rows(table, [args]))
+        else:
+            repository._insert_values(table, [args])  # Computes the lookup key and ignores values already there
+    elif op == "D":
+        cursor.execute("DELETE FROM contacts WHERE id = ?", args)
+    else:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in CONTACT_COLUMNS)
+        changed = " OR ".join(f"{column} IS NOT excluded.{column}" for column in CONTACT_COLUMNS)  # Identical rows are not rewritten, nor logged again
+        cursor.execute(f"""
+            INSERT INTO contacts (id, {', '.join(CONTACT_COLUMNS)}) VALUES (?, {', '.join('?' * len(CONTACT_COLUMNS))})
+            ON CONFLICT (id) DO UPDATE SET {updates} WHERE {changed}
+        """, args)
+
+
+def _add_ranges(repository, ranges):
+    cursor = repository.cursor
+    for first, owner in ranges:
+        cursor.execute("SELECT node_id FROM sync_ranges WHERE first_contact_id = ?", (first,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT INTO sync_ranges (first_contact_id, node_id) VALUES (?, ?)", (first, owner))
+        elif row[0] != owner:
+            raise ValueError(f"Contact IDs from {first + 1} belong to node {row[0]} here, not to node {owner}.")
+
+
+def apply_changes(repository, batch):
+    """
+    Applies a batch from export_changes in one transaction and records its
+    sequence for the source node, together with the owners of the contact ID
+    ranges it lists. Returns the number of changes applied, 0 if the batch
+    was applied already. Raises ValueError if changes from an earlier batch
+    are missing, or if a range of the batch belongs to another node here:
+    its contacts would overwrite different contacts with the same IDs.
+    """
+    with repository.pool.write_lock:
+        applied = peer_seq(repository, batch["node"])
+        if batch["to"] <= applied:
+            return 0
+        if batch["from"] > applied:
+            raise ValueError(f"Changes {applied + 1} to {batch['from']} of node {batch['node']} were never applied.")
+        try:
+            _add_ranges(repository, batch["ranges"])
+            for change in batch["changes"]:
+                _apply_change(repository, *change)
+            repository.cursor.execute("""
+                INSERT INTO sync_peers (node_id, last_seq) VALUES (?, ?)
+                ON CONFLICT (node_id) DO UPDATE SET last_seq = excluded.last_seq
+            """, (batch["node"], batch["to"]))
+            repository.conn.commit()
+        except Exception:
+            repository.conn.rollback()
+            raise
+        repository.cache.clear()
+    return len(batch["changes"])
+
+
+def sync(source, target, batch_size=SYNC_BATCH_SIZE, progress=None):
+    """
+    Ships every change of `source` not yet applied on `target`, `batch_size`
+    log entries at a time, calling progress(last sequence applied) after each
+    batch. Returns the number of changes applied.
+    """
+    node = node_id(source)
+    if node == node_id(target):
+        raise ValueError("Both databases have the same node ID; give the copy a new one with new_node_id.")
+    after = peer_seq(target, node)
+    total = 0
+    while True:
+        batch = export_changes(source, after, batch_size)
+        if batch["to"] == after:
+            return total
+        total += apply_changes(target, batch)
+        after = batch["to"]
+        if progress:
+            progress(after)
+
+
+def prune(repository, seq):
+    """
+    Deletes the change log up to sequence `seq`, once every peer has applied it.
+    Returns the number of entries deleted.
+    """
+    with repository.pool.write_lock:
+        repository.cursor.execute("DELETE FROM change_log WHERE seq <= ?", (seq,))
+        deleted = repository.cursor.rowcount
+        repository.conn.commit()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the changes of one contact database to another.")
+    parser.add_argument("source", help="Database to read changes from.")
+    parser.add_argument("target", help="Database to apply them to (created if missing).")
+    parser.add_argument("--batch-size", type=int, default=SYNC_BATCH_SIZE, help="Change log entries per batch.")
+    args = parser.parse_args()
+
+    source, target = ContactRepository(args.source), ContactRepository(args.target)
+    total = sync(source, target, args.batch_size, lambda seq: print(f"Applied changes up to {seq}"))
+    print(f"Done: {total} changes applied to '{args.target}'.")
+    source.close()
+    target.close()
+
+
+if __name__ == "__main__":
+    main()
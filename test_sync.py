@@ -0,0 +1,115 @@
+"""
+Replication between two local database files with sync.py. Run with:
+
+    python -m pytest test_sync.py
+"""
+import shutil
+
+import pytest
+
+import sync
+from repository import ContactRepository
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    first, second = ContactRepository(str(tmp_path / "a.db")), ContactRepository(str(tmp_path / "b.db"))
+    yield first, second
+    first.close()
+    second.close()
+
+
+def contents(repository):
+    return [contact.to_dict() for contact in repository.iter_contacts()]
+
+
+def sync_both(first, second):
+    sync.sync(first, second)
+    sync.sync(second, first)
+
+
+def test_independent_writes_on_both_nodes_are_kept(nodes):
+    first, second = nodes
+    # Both nodes number their phones from 1, and their contacts from ranges of their own
+    alice = first.create_contact("Alice", ["0911 111 111"], ["alice@example.com"], ["1 Main St"])
+    bob = second.create_contact("Bob", ["0922 222 222"], ["bob@example.com"], ["2 Side St"])
+    assert alice != bob
+
+    sync_both(first, second)
+
+    assert contents(first) == contents(second)
+    assert sorted(contact["name"] for contact in contents(second)) == ["Alice", "Bob"]
+    assert second.find_by_phone("+84911111111") == [alice]
+    assert first.find_by_phone("+84922222222") == [bob]
+
+
+def test_contacts_of_a_range_owned_by_another_node_are_refused(nodes):
+    first, second = nodes
+    # As if both nodes had picked the same range of contact IDs
+    shared = first.conn.execute("SELECT first_contact_id FROM sync_node").fetchone()[0]
+    second.conn.execute("UPDATE sync_node SET first_contact_id = ?, last_contact_id = ?", (shared, shared))
+    second.conn.execute("UPDATE sync_ranges SET first_contact_id = ?", (shared,))
+    second.conn.commit()
+    alice, bob = first.create_contact("Alice"), second.create_contact("Bob")
+    assert alice == bob
+
+    with pytest.raises(ValueError):
+        sync.sync(first, second)
+    assert [contact["name"] for contact in contents(second)] == ["Bob"]
+
+
+def test_copied_node_gets_a_new_range(nodes, tmp_path):
+    first, second = nodes
+    alice = first.create_contact("Alice")
+    first.close()
+    shutil.copy(tmp_path / "a.db", tmp_path / "c.db")
+    first, copy = ContactRepository(str(tmp_path / "a.db")), ContactRepository(str(tmp_path / "c.db"))
+    sync.new_node_id(copy)
+    bob, carol = first.create_contact("Bob"), copy.create_contact("Carol")
+    assert len({alice, bob, carol}) == 3
+
+    sync.sync(first, second)
+    sync.sync(copy, second)
+
+    assert sorted(contact["name"] for contact in contents(second)) == ["Alice", "Bob", "Carol"]
+    first.close()
+    copy.close()
+
+
+def test_updates_and_deletes_replicate(nodes):
+    first, second = nodes
+    alice = first.create_contact("Alice", ["0911 111 111", "0933 333 333"], ["alice@example.com"])
+    carol = first.create_contact("Carol", ["0944 444 444"])
+    sync.sync(first, second)
+
+    first.update_name(alice, "Alice Smith")
+    first.remove_phone(alice, "0933 333 333")
+    first.add_email(alice, "alice@work.example")
+    first.delete_contact(carol)
+    sync.sync(first, second)
+
+    assert contents(first) == contents(second)
+    assert second.get_contact(carol) is None
+    assert second.get_contact(alice).phones == ("0911 111 111",)
+
+
+def test_applying_twice_changes_nothing(nodes):
+    first, second = nodes
+    first.create_contact("Alice", ["0911 111 111"])
+    batch = sync.export_changes(first)
+    assert sync.apply_changes(second, batch) == len(batch["changes"])
+    assert sync.apply_changes(second, batch) == 0
+    assert sync.sync(first, second) == 0
+    # Shipping the changes back rewrites nothing, so nothing new is logged to echo again
+    logged = first.conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    sync.sync(second, first)
+    assert first.conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == logged
+    assert contents(first) == contents(second)
+
+
+def test_missing_batch_is_refused(nodes):
+    first, second = nodes
+    first.create_contact("Alice")
+    batch = sync.export_changes(first, after=1)
+    with pytest.raises(ValueError):
+        sync.apply_changes(second, batch)
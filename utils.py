@@ -19,4 +19,55 @@ def special_input(prompt, step=None):
         elif user_input.lower() == "back":
             print("Returning to the previous step...")
             raise ReturnToPreviousStep
-        return user_input
\ No newline at end of file
+        return user_input
+
+def clean_values(values):
+    """
+    Strips a list of phones, emails or addresses (or a single string of them
+    separated by ';') and drops empty and repeated entries, keeping their order.
+    """
+    if isinstance(values, str):
+        values = values.split(";")
+    cleaned = []
+    for value in values or []:
+        value = str(value).strip()
+        if value and value not in cleaned:
+            cleaned.append(value)
+    return cleaned
+
+def phone_digits(phone):
+    """
+    Returns only the digits of a phone number, e.g. "+84 (912) 345-678" -> "84912345678".
+    """
+    return "".join(char for char in phone if char.isdigit())
+
+DEFAULT_COUNTRY_CODE = "84"  # Calling code given to national numbers
+MAX_NATIONAL_DIGITS = 10  # Longer numbers written without "+", "00" or "0" already start with their calling code
+
+def phone_key(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Returns the canonical E.164-style key of a phone number, "+" and its digits,
+    e.g. "0912 345 678", "912 345 678", "+84 912-345-678" and "0084912345678"
+    -> "+84912345678". A number written without "+", "00" or a trunk "0" is
+    national if it has at most MAX_NATIONAL_DIGITS digits, so "912345678" and
+    "113" get `country_code`, and international otherwise, so "84912345678"
+    keeps its own. Returns None if the number has no digits.
+    """
+    phone = phone.strip()
+    digits = phone_digits(phone)
+    if not digits:
+        return None
+    if not phone.startswith("+"):
+        if digits.startswith("00"):  # International prefix
+            digits = digits[2:]
+        elif digits.startswith("0"):  # National trunk prefix
+            digits = country_code + digits[1:]
+        elif len(digits) <= MAX_NATIONAL_DIGITS:
+            digits = country_code + digits
+    return "+" + digits
+
+def email_key(email):
+    """
+    Returns the form of an email address used to compare it: trimmed and lowercased.
+    """
+    return email.strip().lower()